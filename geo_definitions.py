@@ -1,4 +1,8 @@
 # -*- coding: utf-8 -*-
+import functools
+
+from qgis.core import QgsCoordinateReferenceSystem
+
 REGIONS = {
         'Guadeloupe_Martinique': {
             'bbox': [-63.5, 14.0, -60.0, 18.5], 
@@ -34,4 +38,51 @@ MANUAL_DEFS = {
     "EPSG:2975": "+proj=utm +zone=40 +south +ellps=GRS80 +towgs84=0,0,0,0,0,0,0 +units=m +no_defs", # Reunion
     "EPSG:4471": "+proj=utm +zone=38 +south +ellps=GRS80 +towgs84=0,0,0,0,0,0,0 +units=m +no_defs", # Mayotte
     "EPSG:4467": "+proj=utm +zone=21 +ellps=GRS80 +towgs84=0,0,0,0,0,0,0 +units=m +no_defs"  # St Pierre et Miquelon
-}
\ No newline at end of file
+}
+
+
+@functools.lru_cache(maxsize=64)
+def crs_from_authid(auth_id):
+    """
+    Returns a cached QgsCoordinateReferenceSystem for an authority id (e.g. "EPSG:2154")
+
+    Args:
+        auth_id (str): Authority id
+
+    Returns:
+        QgsCoordinateReferenceSystem: CRS created from the authority id
+    """
+    return QgsCoordinateReferenceSystem(auth_id)
+
+
+@functools.lru_cache(maxsize=None)
+def manual_crs(auth_id):
+    """
+    Returns the CRS built from the MANUAL_DEFS proj string of an authority id.
+    The proj string is only parsed once per session
+
+    Args:
+        auth_id (str): Authority id, must be a key of MANUAL_DEFS
+
+    Returns:
+        QgsCoordinateReferenceSystem: CRS created from the proj definition
+    """
+    return QgsCoordinateReferenceSystem.fromProj4(MANUAL_DEFS[auth_id])
+
+
+@functools.lru_cache(maxsize=None)
+def proj_params(auth_id):
+    """
+    Returns the parameters of the MANUAL_DEFS proj string of an authority id
+
+    Args:
+        auth_id (str): Authority id, e.g. "EPSG:2154"
+
+    Returns:
+        dict: Parameter name -> value (str), empty if auth_id has no manual definition
+    """
+    params = {}
+    for token in MANUAL_DEFS.get(auth_id, "").split():
+        key, _, value = token.lstrip('+').partition('=')
+        params[key] = value
+    return params
@@ -43,11 +43,11 @@ from qgis.core import (QgsProcessing,
                         QgsProcessingParameterNumber,
                         QgsProcessingParameterPoint,
                         QgsProcessingParameterBoolean,
+                        QgsProcessingParameterDefinition,
                         QgsPoint,
                         QgsProcessingException,
                         QgsProcessingParameterRasterDestination,
                         QgsProcessingParameterFileDestination,
-                        QgsCoordinateReferenceSystem,
                         QgsFields,
                         QgsWkbTypes,
                         QgsFeature,
@@ -66,6 +66,7 @@ from qgis.core import (QgsProcessing,
 from .mns_downloader import MNSDownloader
 from .trail import Trail
 from .shadow_calculator import ShadowCalculator
+from .geo_definitions import crs_from_authid
 
 
 class MarcheALOmbreAlgorithm(QgsProcessingAlgorithm):
@@ -98,6 +99,7 @@ class MarcheALOmbreAlgorithm(QgsProcessingAlgorithm):
     OUTPUT_POINTS = 'OUTPUT_POINTS'
     LOW_RES_MNS = 'LOW_RES_MNS'
     OUTPUT_CSV = 'OUTPUT_CSV'
+    PARALLEL_DOWNLOADS = 'PARALLEL_DOWNLOADS'
 
     def initAlgorithm(self, config):
         """
@@ -176,6 +178,19 @@ class MarcheALOmbreAlgorithm(QgsProcessingAlgorithm):
             )
         )
 
+        # Advanced: number of simultaneous tile requests to the IGN WMS.
+        # Raising it speeds up large downloads but increases the load on the service.
+        parallel_downloads = QgsProcessingParameterNumber(
+            self.PARALLEL_DOWNLOADS,
+            self.tr('Parallel tile downloads (see IGN terms of use before increasing)'),
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=MNSDownloader.MAX_PARALLEL_TILES,
+            minValue=1,
+            maxValue=16
+        )
+        parallel_downloads.setFlags(parallel_downloads.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(parallel_downloads)
+
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 self.OUTPUT_POINTS,
@@ -224,14 +239,12 @@ class MarcheALOmbreAlgorithm(QgsProcessingAlgorithm):
         reverse_direction = self.parameterAsBool(parameters, self.REVERSE_DIRECTION, context)
         buffer_mode = self.parameterAsBool(parameters, self.BUFFER_MODE, context)
         csv_path = self.parameterAsFileOutput(parameters, self.OUTPUT_CSV, context)
+        parallel_downloads = self.parameterAsInt(parameters, self.PARALLEL_DOWNLOADS, context)
 
         if not picnic_point or (picnic_point.x() == 0.0 and picnic_point.y() == 0.0):
             picnic_point_crs = None
 
-        # Compute the number of steps to display within the progress bar and
-        # get features from source
-        total = 100.0 / source.featureCount() if source.featureCount() else 0
-        features = source.getFeatures()
+        # Progress bar: MNT download 0-10%, MNS downloads 10-80%, writing the results 80-100%
 
         ########################## TRAIL PROCESSING #########################
         feedback.pushInfo("Processing trail...")
@@ -265,7 +278,9 @@ class MarcheALOmbreAlgorithm(QgsProcessingAlgorithm):
         downloader = MNSDownloader(
             crs=target_crs, 
             transform_context=context.transformContext(), 
-            feedback=feedback)
+            feedback=feedback,
+            max_connections=parallel_downloads,
+            progress=(0.0, 10.0))
         target_resolution = 0.5
         # Download MNT (mns=False)
         success_mnt = downloader.read_tif(
@@ -291,7 +306,9 @@ class MarcheALOmbreAlgorithm(QgsProcessingAlgorithm):
         downloader = MNSDownloader(
             crs=target_crs,
             transform_context=context.transformContext(), 
-            feedback=feedback)
+            feedback=feedback,
+            max_connections=parallel_downloads,
+            progress=(10.0, 70.0))
 
         downloader.download_dual_quality_mns(
             trail_extent=trail.extent,
@@ -302,15 +319,10 @@ class MarcheALOmbreAlgorithm(QgsProcessingAlgorithm):
             high_res=target_resolution, # meters per pixel
         )
         
-        # Open MNS raster with GDAL
+        # Check the MNS can be opened (header only, ShadowCalculator reads the data)
         ds = gdal.Open(output_path)
         if ds is None:
             raise QgsProcessingException("Could not open downloaded MNS.")
-            
-        mns_band = ds.GetRasterBand(1)
-        mns_array = mns_band.ReadAsArray() # Returns numpy array
-        geo_transform = ds.GetGeoTransform()
-            
         ds = None # Close dataset
 
         ########################## CALCULATE SHADOWS ############################
@@ -376,7 +388,7 @@ class MarcheALOmbreAlgorithm(QgsProcessingAlgorithm):
             context, 
             fields, 
             QgsWkbTypes.PointZ,
-            QgsCoordinateReferenceSystem(target_crs)
+            crs_from_authid(target_crs)
         )
         self.point_dest_id = point_dest_id
 
@@ -418,7 +430,7 @@ class MarcheALOmbreAlgorithm(QgsProcessingAlgorithm):
                 course
             ])
             point_sink.addFeature(feat, QgsFeatureSink.FastInsert)
-            feedback.setProgress(int(i * total))
+            feedback.setProgress(80.0 + 20.0 * (i + 1) / len(trail.trail_points))
 
         # Return the results of the algorithm. In this case our only result is
         # the feature sink which contains the processed features, but some
@@ -439,7 +451,7 @@ class MarcheALOmbreAlgorithm(QgsProcessingAlgorithm):
         # Set project CRS to match the detected region
         detected_crs_str = self.results.get('detected_crs')
         if detected_crs_str:
-            detected_crs = QgsCoordinateReferenceSystem(detected_crs_str)
+            detected_crs = crs_from_authid(detected_crs_str)
             project = context.project()
             
             if detected_crs.isValid() and project.crs().authid() != detected_crs.authid():
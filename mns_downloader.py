@@ -5,31 +5,84 @@ Copyright (C) 2025 Yolanda Seifert
 Licensed under GPL v2+
 """
 import os
+import io
+import uuid
+import functools
 import time
 import math
-import tempfile
-import shutil
+import re
 import xml.etree.ElementTree as ET
+from email.utils import formatdate
 
 from qgis.core import (
     QgsNetworkAccessManager, 
     QgsRectangle, 
-    QgsCoordinateReferenceSystem,
-    QgsCoordinateTransform
+    QgsCoordinateTransform,
+    QgsSpatialIndex
 )
-from qgis.PyQt.QtCore import QUrl, QCoreApplication, QEventLoop
+from qgis.PyQt.QtCore import QUrl, QUrlQuery, QEventLoop, QStandardPaths
 from qgis.PyQt.QtNetwork import QNetworkRequest, QNetworkReply
 from osgeo import gdal, osr
 
-from .geo_definitions import MANUAL_DEFS
+from .geo_definitions import MANUAL_DEFS, manual_crs, crs_from_authid
+
+# Qualified tag names of the WMS 1.3.0 capabilities document
+WMS_NS = "{http://www.opengis.net/wms}"
+WMS_LAYER = WMS_NS + "Layer"
+WMS_NAME = WMS_NS + "Name"
+WMS_GEO_BBOX = WMS_NS + "EX_GeographicBoundingBox"
+WMS_WEST = WMS_NS + "westBoundLongitude"
+WMS_EAST = WMS_NS + "eastBoundLongitude"
+WMS_SOUTH = WMS_NS + "southBoundLatitude"
+WMS_NORTH = WMS_NS + "northBoundLatitude"
+WMS_GETMAP = WMS_NS + "GetMap"
+WMS_FORMAT = WMS_NS + "Format"
+
+
+@functools.lru_cache(maxsize=32)
+def _osr_wkt_from_user_input(user_input):
+    """
+    Returns the cached WKT of a GDAL/OSR spatial reference definition
+    """
+    srs = osr.SpatialReference()
+    srs.SetFromUserInput(user_input)
+    return srs.ExportToWkt()
+
 
 class MNSDownloader:
 
     BASE_URL = "https://data.geopf.fr/wms-r"
     CAPABILITIES_URL = f"{BASE_URL}?SERVICE=WMS&VERSION=1.3.0&REQUEST=GetCapabilities"
     TILE_SIZE_PX = 4000 
+    MAX_PARALLEL_TILES = 4 # default connections to data.geopf.fr, keep it low to respect the service terms of use
+    CAPABILITIES_TTL_S = 7 * 24 * 3600 # capabilities change on the order of weeks
+    NODATA_VALUE = -9999.0
+    NODATA_THRESHOLD = -1000.0 # every elevation below this is a service sentinel, stored as NODATA_VALUE
+    MAX_BLOCK_CACHE_BYTES = 1024 * 1024 * 1024 # upper bound of the GDAL block cache while merging tiles
+    # Elevations stay Float32 (alpine MNS heights do not fit Int16 centimeters),
+    # the floating point predictor makes DEFLATE far more effective on them
+    GTIFF_OPTIONS = ['TILED=YES', 'BLOCKXSIZE=512', 'BLOCKYSIZE=512', 'COMPRESS=DEFLATE', 'PREDICTOR=3']
+
+    # Layer scoring per model type (is_mns):
+    # (regional LiDAR HD pattern, global LiDAR HD fallback, HIGHRES fallback)
+    # The pattern matches names containing LIDAR-HD and MNS/MNT but not WGS84G
+    _SCORING_TABLES = {
+        True: (
+            re.compile(r"(?!.*WGS84G)(?=.*LIDAR-HD).*MNS"),
+            "IGNF_LIDAR-HD_MNS_ELEVATION.ELEVATIONGRIDCOVERAGE.WGS84G",
+            "ELEVATION.ELEVATIONGRIDCOVERAGE.HIGHRES.MNS"
+        ),
+        False: (
+            re.compile(r"(?!.*WGS84G)(?=.*LIDAR-HD).*MNT"),
+            "IGNF_LIDAR-HD_MNT_ELEVATION.ELEVATIONGRIDCOVERAGE.WGS84G",
+            "ELEVATION.ELEVATIONGRIDCOVERAGE.HIGHRES"
+        )
+    }
+    SOURCE_NODATA = -99999.0 # NoData of the IGN elevation services if not declared in the file
+    # GetMap output formats by preference, all single band GeoTIFF that GDAL reads from memory
+    PREFERRED_FORMATS = ("image/geotiff", "image/tiff")
 
-    def __init__(self, crs, transform_context, feedback=None):
+    def __init__(self, crs, transform_context, feedback=None, max_connections=None, progress=None):
         """
         Initializes the downloader
 
@@ -37,12 +90,36 @@ class MNSDownloader:
             crs (str): The epsg string of the target CRS
             transform_context (QgsCoordinateTransformContext): Context for coordinate transforms
             feedback (QgsProcessingFeedback, optional): Feedback object for logging
+            max_connections (int, optional): Tiles downloaded in parallel. Defaults to MAX_PARALLEL_TILES.
+                                             High values put a heavy load on the IGN service.
+            progress (tuple[float, float], optional): (start, span) in percent of the feedback progress bar
+                                                      the downloads may use. Defaults to None (progress not reported).
         """
         self.manager = QgsNetworkAccessManager.instance()
         self.crs = crs
         self.transform_context = transform_context
         self.feedback = feedback
-        self._capabilities_xml_cache = None
+        self.max_connections = max(1, int(max_connections or self.MAX_PARALLEL_TILES))
+        self.progress = progress
+        self._layer_index = None
+        self._getmap_formats = ()
+        # Unique in-memory directory, parallel runs must not share /vsimem/ files
+        self._vsimem_dir = f"/vsimem/marche_a_lombre_{uuid.uuid4().hex}"
+        self._layer_tree = None
+        self._transforms = {}
+        # self.crs does not change, resolve its WKT once for all tiles
+        self._projection_wkt = _osr_wkt_from_user_input(crs)
+
+        # GetMap parameters that are the same for every tile of the session
+        self._getmap_query = QUrlQuery()
+        for key, value in (("SERVICE", "WMS"),
+                           ("VERSION", "1.3.0"),
+                           ("REQUEST", "GetMap"),
+                           ("STYLES", "normal"),
+                           ("CRS", crs),
+                           ("TRANSPARENT", "false")):
+            self._getmap_query.addQueryItem(key, value)
+        self._layer_queries = {}
 
     def log(self, message):
         if self.feedback:
@@ -50,22 +127,131 @@ class MNSDownloader:
         else:
             print(message)
 
+    def _transform_to_wgs84(self, auth_id, manual=False):
+        """
+        Returns a (cached) ballpark-enabled transform from a CRS to WGS84
+
+        Args:
+            auth_id (str): Authority id of the source CRS
+            manual (bool, optional): Build the source CRS from MANUAL_DEFS. Defaults to False.
+
+        Returns:
+            QgsCoordinateTransform: transform to EPSG:4326
+        """
+        key = (auth_id, manual)
+        transform = self._transforms.get(key)
+        if transform is None:
+            if manual:
+                source_ref = manual_crs(auth_id)
+            else:
+                source_ref = crs_from_authid(auth_id)
+            transform = QgsCoordinateTransform(source_ref, crs_from_authid("EPSG:4326"), self.transform_context)
+            transform.setBallparkTransformsAreAppropriate(True)
+            self._transforms[key] = transform
+        return transform
+
+    def _capabilities_cache_paths(self):
+        """
+        Returns the location of the on-disk capabilities cache
+
+        Returns:
+            tuple[str, str]: (xml_path, stamp_path)
+        """
+        cache_dir = os.path.join(
+            QStandardPaths.writableLocation(QStandardPaths.CacheLocation), "marche_a_lombre"
+        )
+        return os.path.join(cache_dir, "capabilities.xml"), os.path.join(cache_dir, "capabilities.stamp")
+
+    def _load_capabilities(self, source):
+        """
+        Streams a capabilities document and keeps only what layer selection
+        and GetMap requests need
+
+        Args:
+            source (str | file object): path or binary file object of the XML
+
+        Returns:
+            list[dict]: layers with 'name' and 'bbox' (west, east, south, north)
+
+        Raises:
+            xml.etree.ElementTree.ParseError: If the document is malformed
+        """
+        layers = []
+        formats = []
+        for _, elem in ET.iterparse(source, events=("end",)):
+            if elem.tag == WMS_GETMAP:
+                formats = [child.text.strip() for child in elem if child.tag == WMS_FORMAT and child.text]
+                continue
+            if elem.tag != WMS_LAYER:
+                continue
+
+            # Single pass over the direct children
+            name = geo_bbox = None
+            for child in elem:
+                if child.tag == WMS_NAME:
+                    name = child.text
+                elif child.tag == WMS_GEO_BBOX:
+                    geo_bbox = child
+
+            if name and geo_bbox is not None:
+                try:
+                    bounds = {child.tag: child.text for child in geo_bbox}
+                    layers.append({
+                        'name': name,
+                        'bbox': (float(bounds[WMS_WEST]), float(bounds[WMS_EAST]),
+                                 float(bounds[WMS_SOUTH]), float(bounds[WMS_NORTH]))
+                    })
+                except (KeyError, TypeError, ValueError):
+                    pass
+
+            # Release the subtree, nested layers end before their parent
+            elem.clear()
+
+        self._layer_index = layers
+        self._getmap_formats = tuple(formats)
+        return layers
+
+    def _getmap_format(self):
+        """
+        Picks the GetMap output format from the formats advertised by the service
+
+        Returns:
+            str: MIME type, image/tiff if the capabilities list none of PREFERRED_FORMATS
+        """
+        for fmt in self.PREFERRED_FORMATS:
+            if fmt in self._getmap_formats:
+                return fmt
+        return "image/tiff"
+
     def _fetch_capabilities(self):
         """
-        Fetches WMS Capabilities to find layers dynamically
+        Fetches WMS Capabilities to find layers dynamically.
+        The document is cached on disk for CAPABILITIES_TTL_S seconds, after that
+        it is revalidated with a conditional GET
 
         Returns:
-            xml.etree.ElementTree.Element: root element of the parsed XML
+            list[dict]: layer index with 'name' and 'bbox' (west, east, south, north)
 
         Raises:
-            Exception: If the network request fails
+            Exception: If the network request fails and no cached copy exists
         """
-        if self._capabilities_xml_cache is not None:
-            return self._capabilities_xml_cache
+        if self._layer_index is not None:
+            return self._layer_index
+
+        xml_path, stamp_path = self._capabilities_cache_paths()
+        has_cache = os.path.exists(xml_path) and os.path.exists(stamp_path)
+
+        if has_cache and time.time() - os.path.getmtime(stamp_path) < self.CAPABILITIES_TTL_S:
+            try:
+                return self._load_capabilities(xml_path)
+            except ET.ParseError:
+                has_cache = False
 
         self.log("Fetching WMS Capabilities...")
-        request = QNetworkRequest(QUrl(self.CAPABILITIES_URL))
-        request.setAttribute(QNetworkRequest.FollowRedirectsAttribute, True)
+        request = self._new_request(QUrl(self.CAPABILITIES_URL))
+        if has_cache:
+            modified = formatdate(os.path.getmtime(xml_path), usegmt=True)
+            request.setRawHeader(b"If-Modified-Since", modified.encode('ascii'))
         
         reply = self.manager.get(request)
         
@@ -74,11 +260,29 @@ class MNSDownloader:
         loop.exec_()
         
         if reply.error() != QNetworkReply.NoError:
-            raise Exception(f"Capabilities failed: {reply.errorString()}")
+            if not has_cache:
+                raise Exception(f"Capabilities failed: {reply.errorString()}")
+            self.log(f"Capabilities failed: {reply.errorString()}. Using cached copy.")
+            return self._load_capabilities(xml_path)
+
+        if has_cache and reply.attribute(QNetworkRequest.HttpStatusCodeAttribute) == 304:
+            # Not modified: extend lifetime of cached copy
+            os.utime(stamp_path)
+            return self._load_capabilities(xml_path)
+
+        content = bytes(reply.readAll())
+        self._load_capabilities(io.BytesIO(content))
+
+        try:
+            os.makedirs(os.path.dirname(xml_path), exist_ok=True)
+            with open(xml_path, 'wb') as f:
+                f.write(content)
+            with open(stamp_path, 'w') as f:
+                f.write(formatdate(usegmt=True))
+        except OSError as e:
+            self.log(f"Warning: Could not cache capabilities: {e}")
 
-        content = reply.readAll()
-        self._capabilities_xml_cache = ET.fromstring(content)
-        return self._capabilities_xml_cache
+        return self._layer_index
 
     def get_layer_candidates(self, wgs84_point, is_mns=True):
         """
@@ -93,78 +297,74 @@ class MNSDownloader:
             list[dict]: A list of layer candidates containing 'name' and 'score'.
         """
         try:
-            root = self._fetch_capabilities()
+            layers = self._fetch_capabilities()
         except Exception as e:
             self.log(f"Error fetching capabilities: {e}")
             return []
 
-        ns = {'wms': 'http://www.opengis.net/wms'}
         candidates = []
         
-        if is_mns:
-            search_type = "MNS"
-            fallback_lidar_global = "IGNF_LIDAR-HD_MNS_ELEVATION.ELEVATIONGRIDCOVERAGE.WGS84G"
-            fallback_highres = "ELEVATION.ELEVATIONGRIDCOVERAGE.HIGHRES.MNS"
-        else:
-            search_type = "MNT"
-            fallback_lidar_global = "IGNF_LIDAR-HD_MNT_ELEVATION.ELEVATIONGRIDCOVERAGE.WGS84G"
-            fallback_highres = "ELEVATION.ELEVATIONGRIDCOVERAGE.HIGHRES"
-
-        for layer in root.findall('.//wms:Layer', ns):
-            name_elem = layer.find('wms:Name', ns)
-            if name_elem is None: continue
-            name = name_elem.text
-            
+        lidar_pattern, fallback_lidar_global, fallback_highres = self._SCORING_TABLES[bool(is_mns)]
+
+        # R-tree over the layer bounding boxes, built once per capabilities index
+        if self._layer_tree is None:
+            self._layer_tree = QgsSpatialIndex()
+            for i, layer in enumerate(layers):
+                w, e, s, n = layer['bbox']
+                self._layer_tree.addFeature(i, QgsRectangle(w, s, e, n))
+
+        px, py = wgs84_point.x(), wgs84_point.y()
+
+        for i in self._layer_tree.intersects(QgsRectangle(px, py, px, py)):
+            layer = layers[i]
+            name = layer['name']
             if "SHADOW" in name: continue
 
-            geo_bbox = layer.find('wms:EX_GeographicBoundingBox', ns)
-            if geo_bbox is None: continue
+            # Score by name, only layers covering the point are left
+            score = 0
+            if lidar_pattern.match(name):
+                score = 1000 
+            elif name == fallback_lidar_global:
+                score = 500
+            elif name == fallback_highres:
+                score = 100
 
-            try:
-                w = float(geo_bbox.find('wms:westBoundLongitude', ns).text)
-                e = float(geo_bbox.find('wms:eastBoundLongitude', ns).text)
-                s = float(geo_bbox.find('wms:southBoundLatitude', ns).text)
-                n = float(geo_bbox.find('wms:northBoundLatitude', ns).text)
-                
-                # Check if point is inside the layer
-                px, py = wgs84_point.x(), wgs84_point.y()
-                if not (w <= px <= e and s <= py <= n):
-                    continue
-                    
-                score = 0
-                if search_type in name and "LIDAR-HD" in name and "WGS84G" not in name:
-                    score = 1000 
-                elif name == fallback_lidar_global:
-                    score = 500
-                elif name == fallback_highres:
-                    score = 100
-
-                if score == 0: continue
-                
-                candidates.append({'name': name, 'score': score})
-            except:
-                continue
+            if score == 0: continue
+
+            candidates.append({'name': name, 'score': score})
 
         return sorted(candidates, key=lambda x: x['score'], reverse=True)
 
-    def validate_raster_content(self, file_path):
+    def validate_raster_content(self, file_path, full=True):
         """
-        Validates the downloaded file by reading it
+        Validates the downloaded file without reading the full raster
 
         Args:
             file_path (str): Path to the file to check
+            full (bool, optional): Also check the data range (NoData / flat).
+                                   False only checks header and a first and last window,
+                                   used per tile before the final result is checked. Defaults to True.
 
         Returns:
             tuple[bool, str]: (isValid, statusMessage)
         """
         try:
-            if os.path.getsize(file_path) < 1000:
-                return False, "File too small (< 1KB)"
-
-            with open(file_path, 'rb') as f:
-                header = f.read(512)
-                if b"ServiceException" in header or b"<?xml" in header:
-                    return False, "Contains WMS XML Error"
+            # One handle for size and header (VSI also handles /vsimem/ files)
+            f = gdal.VSIFOpenL(file_path, 'rb')
+            if f is None:
+                return False, f"Could not open file: {gdal.GetLastErrorMsg() or file_path}"
+            try:
+                gdal.VSIFSeekL(f, 0, os.SEEK_END)
+                size = gdal.VSIFTellL(f)
+                if size < 1000:
+                    return False, "File too small (< 1KB)"
+                gdal.VSIFSeekL(f, 0, os.SEEK_SET)
+                header = gdal.VSIFReadL(1, 512, f)
+            finally:
+                gdal.VSIFCloseL(f)
+
+            if b"ServiceException" in header or b"<?xml" in header:
+                return False, "Contains WMS XML Error"
 
             gdal.PushErrorHandler('CPLQuietErrorHandler') 
             ds = gdal.Open(file_path)
@@ -174,23 +374,45 @@ class MNSDownloader:
                 return False, "GDAL could not open file"
             
             band = ds.GetRasterBand(1)
-            try:
-                data = band.ReadAsArray()
-            except Exception as e:
+
+            # A rendered image (RGB or 8 bit palette) would silently give wrong elevations
+            if ds.RasterCount != 1 or band.DataType == gdal.GDT_Byte:
+                bands, data_type = ds.RasterCount, gdal.GetDataTypeName(band.DataType)
                 ds = None
                 gdal.PopErrorHandler()
-                return False, f"File Truncated/Corrupt: {str(e)}"
-            
-            if data is None:
+                return False, f"Not an elevation raster ({bands} bands, {data_type})"
+
+            # Read a small window at the start and at the end of the data only to detect
+            # corrupt files and truncated responses missing their last strips/tiles
+            gdal.ErrorReset()
+            win_x, win_y = min(256, band.XSize), min(256, band.YSize)
+            band.Checksum(0, 0, win_x, win_y)
+            if gdal.GetLastErrorType() < gdal.CE_Failure:
+                band.Checksum(band.XSize - win_x, band.YSize - win_y, win_x, win_y)
+            if gdal.GetLastErrorType() >= gdal.CE_Failure:
+                msg = gdal.GetLastErrorMsg()
                 ds = None
                 gdal.PopErrorHandler()
-                return False, "ReadAsArray returned None"
+                return False, f"File Truncated/Corrupt: {msg}"
 
-            mn = data.min()
-            mx = data.max()
+            if not full:
+                ds = None
+                gdal.PopErrorHandler()
+                return True, "Valid"
+
+            # Approximate min/max is computed by GDAL on a subsample, no full read
+            try:
+                min_max = band.ComputeRasterMinMax(True)
+            except RuntimeError:
+                min_max = None
             ds = None 
             gdal.PopErrorHandler()
 
+            if min_max is None:
+                # Fails only if every sampled pixel is NoData
+                return False, "All NoData"
+            mn, mx = min_max
+
             if mn <= -9000 and mx <= -9000:
                 return False, f"All NoData (Min:{mn} Max:{mx})"
             
@@ -217,11 +439,7 @@ class MNSDownloader:
         Returns:
             bool: True if download successful
         """
-        # High-Res
-        self.read_tif(trail_extent, high_res, high_res_path, input_crs=input_crs)
-
-        # Low-Res (greater extent)
-        self.log("Downloading large Low Resolution MNS for obstacles at greater distance (e.g. mountains)")
+        # Low-Res covers a greater extent
         buffer_dist = 22000.0 # altitude difference of 2000m with solar elevation of 5° casts 22km shadow
         buffer_n = buffer_dist
         buffer_s = buffer_dist
@@ -236,7 +454,27 @@ class MNSDownloader:
             trail_extent.xMaximum() + buffer_dist,
             trail_extent.yMaximum() + buffer_n
         )
-        return self.read_tif(horizon_extent, low_res, low_res_path, input_crs=input_crs)
+
+        # Share the progress range of the downloader by number of pixels
+        progress = self.progress
+        if progress:
+            start, span = progress
+            high_px = trail_extent.area() / high_res ** 2
+            low_px = horizon_extent.area() / low_res ** 2
+            high_span = span * high_px / (high_px + low_px) if high_px + low_px > 0 else span
+        try:
+            # High-Res
+            if progress:
+                self.progress = (start, high_span)
+            self.read_tif(trail_extent, high_res, high_res_path, input_crs=input_crs)
+
+            # Low-Res (greater extent)
+            self.log("Downloading large Low Resolution MNS for obstacles at greater distance (e.g. mountains)")
+            if progress:
+                self.progress = (start + high_span, span - high_span)
+            return self.read_tif(horizon_extent, low_res, low_res_path, input_crs=input_crs)
+        finally:
+            self.progress = progress
 
     def read_tif(self, extent, resolution, output_path, input_crs, is_mns=True):
         """
@@ -252,26 +490,19 @@ class MNSDownloader:
         Returns:
             bool: True if successful, False otherwise
         """
-        source_ref = QgsCoordinateReferenceSystem(input_crs)
-        wgs84_ref = QgsCoordinateReferenceSystem("EPSG:4326")
-        
-        tr_to_wgs84 = QgsCoordinateTransform(source_ref, wgs84_ref, self.transform_context)
-        tr_to_wgs84.setBallparkTransformsAreAppropriate(True)
+        tr_to_wgs84 = self._transform_to_wgs84(input_crs)
 
         center_input = extent.center()
         center_wgs84 = tr_to_wgs84.transform(center_input)
 
-        auth_id = source_ref.authid()
-        is_identity = (abs(center_input.x() - center_wgs84.x()) < 0.1) and (auth_id != wgs84_ref.authid())
+        auth_id = crs_from_authid(input_crs).authid()
+        is_identity = (abs(center_input.x() - center_wgs84.x()) < 0.1) and (auth_id != "EPSG:4326")
         
         if is_identity: # transformation failed
             if auth_id in MANUAL_DEFS:
                 self.log(f"Switching to Manual Definition for Coordinate Transformation.")
-                # CRS from manual definition
-                source_ref = QgsCoordinateReferenceSystem.fromProj4(MANUAL_DEFS[auth_id])
-                # Redo transform
-                tr_to_wgs84 = QgsCoordinateTransform(source_ref, wgs84_ref, self.transform_context)
-                tr_to_wgs84.setBallparkTransformsAreAppropriate(True)
+                # Redo transform with CRS from manual definition
+                tr_to_wgs84 = self._transform_to_wgs84(auth_id, manual=True)
                 center_wgs84 = tr_to_wgs84.transform(center_input)
             else:
                 self.log("Warning: Transform returned identity and no manual definition available.")
@@ -319,106 +550,258 @@ class MNSDownloader:
 
     def _download_tiled(self, extent, resolution, total_w, total_h, output_path, layer_name):
         """
-        Splits the extent into chunks of max 4000px, downloads them, and merges them
+        Splits the extent into chunks of max 4000px, downloads them in parallel and
+        writes each one directly into the final GeoTIFF
         """
         cols = math.ceil(total_w / self.TILE_SIZE_PX)
         rows = math.ceil(total_h / self.TILE_SIZE_PX)
-        
-        temp_dir = tempfile.mkdtemp()
-        tile_files = []
-        
+
+        # Build the tile grid first: (tile_extent, width_px, height_px)
+        tiles = []
         current_y = extent.yMaximum()
-        
-        try:
-            for i in range(rows):
-                current_x = extent.xMinimum()
-                
-                # Calculate height of this row (last row might be smaller)
-                row_height_px = min(self.TILE_SIZE_PX, total_h - (i * self.TILE_SIZE_PX))
-                row_height_m = row_height_px * resolution
-                
-                for j in range(cols):
-                    if self.feedback and self.feedback.isCanceled():
-                        return False
-
-                    # Calculate width of this col
-                    col_width_px = min(self.TILE_SIZE_PX, total_w - (j * self.TILE_SIZE_PX))
-                    col_width_m = col_width_px * resolution
-
-                    # Define tile extent
-                    tile_extent = QgsRectangle(
-                        current_x, 
-                        current_y - row_height_m, 
-                        current_x + col_width_m, 
-                        current_y
-                    )
-                    
-                    tile_path = os.path.join(temp_dir, f"tile_{i}_{j}.tif")
-                    
-                    self.log(f"Downloading tile {i+1},{j+1} / {rows},{cols} ({col_width_px}x{row_height_px})...")
-
-                    success = self._download_single_tile(
-                        tile_extent, col_width_px, row_height_px, tile_path, layer_name
-                    )
-                    
-                    if not success:
-                        raise Exception("Tile download failed")
-                    
-                    tile_files.append(tile_path)
-                    current_x += col_width_m
-                
-                current_y -= row_height_m
-
-            # Merge tiles using GDAL VRT
-            self.log("Merging tiles...")
-            vrt_options = gdal.BuildVRTOptions(resampleAlg='nearest')
-            vrt_path = os.path.join(temp_dir, "merged.vrt")
-            vrt = gdal.BuildVRT(vrt_path, tile_files, options=vrt_options)
-            vrt = None # Flush to disk
+        for i in range(rows):
+            current_x = extent.xMinimum()
             
-            # Translate VRT to final TIFF
-            translate_options = gdal.TranslateOptions(format='GTiff', creationOptions=['COMPRESS=DEFLATE', 'TILED=YES'])
-            gdal.Translate(output_path, vrt_path, options=translate_options)
+            # Calculate height of this row (last row might be smaller)
+            row_height_px = min(self.TILE_SIZE_PX, total_h - (i * self.TILE_SIZE_PX))
+            row_height_m = row_height_px * resolution
+            
+            for j in range(cols):
+                # Calculate width of this col
+                col_width_px = min(self.TILE_SIZE_PX, total_w - (j * self.TILE_SIZE_PX))
+                col_width_m = col_width_px * resolution
+
+                # Define tile extent
+                tile_extent = QgsRectangle(
+                    current_x, 
+                    current_y - row_height_m, 
+                    current_x + col_width_m, 
+                    current_y
+                )
+                
+                tiles.append((tile_extent, col_width_px, row_height_px))
+                current_x += col_width_m
             
+            current_y -= row_height_m
+
+        # Create the output raster up front, tiles are pasted into it as they arrive
+        driver = gdal.GetDriverByName('GTiff')
+        out_ds = driver.Create(
+            output_path, total_w, total_h, 1, gdal.GDT_Float32,
+            options=self.GTIFF_OPTIONS + ['SPARSE_OK=TRUE', 'NUM_THREADS=ALL_CPUS']
+        )
+        if out_ds is None:
+            self.log(f"Error during tiled download: Could not create {output_path}")
+            return False
+
+        out_ds.SetGeoTransform([extent.xMinimum(), resolution, 0, extent.yMaximum(), 0, -resolution])
+        out_ds.SetProjection(self._projection_wkt)
+        out_ds.GetRasterBand(1).SetNoDataValue(self.NODATA_VALUE)
+
+        def write_tile(index, content):
+            tile_extent, width, height = tiles[index]
+            self._paste_tile(content, out_ds, tile_extent, width, height, f"{self._vsimem_dir}/tile_{index}.tif")
+
+        # Tiles arrive in any order and share the 512px blocks at their seams: keep the
+        # output blocks cached so seam blocks are compressed once, not re-read and re-encoded
+        cache_max = gdal.GetCacheMax()
+        gdal.SetCacheMax(max(cache_max, min(total_w * total_h * 4, self.MAX_BLOCK_CACHE_BYTES)))
+        try:
+            self.log(f"Downloading {rows}x{cols} tiles ({self.max_connections} in parallel)...")
+            success = self._fetch_tiles(tiles, layer_name, write_tile)
+
+            out_ds.FlushCache()
+            out_ds = None
+        finally:
+            gdal.SetCacheMax(cache_max)
+
+        if not success:
+            self.log("Error during tiled download: Tile download failed")
+            driver.Delete(output_path)
+        return success
+
+    def _paste_tile(self, content, out_ds, tile_extent, width, height, mem_path):
+        """
+        Decodes a downloaded tile in memory and warps it into the output raster
+
+        Args:
+            content (bytes): Raw GetMap response
+            out_ds (gdal.Dataset): Merged output raster
+            tile_extent (QgsRectangle): Extent covered by the tile
+            width (int): Expected width of the tile in pixels
+            height (int): Expected height of the tile in pixels
+            mem_path (str): /vsimem/ path used to decode the tile
+
+        Raises:
+            Exception: If the tile is invalid
+        """
+        gdal.FileFromMemBuffer(mem_path, content)
+        try:
+            is_valid, status_msg = self.validate_raster_content(mem_path, full=False)
+            if not is_valid:
+                raise Exception(f"Tile validation failed: {status_msg}")
+            self._embed_georeferencing(mem_path, out_ds, tile_extent, size=(width, height))
+        finally:
+            gdal.Unlink(mem_path)
+
+    def _fetch_tiles(self, tiles, layer_name, write_tile):
+        """
+        Downloads the GetMap responses of all tiles, keeping at most
+        max_connections requests in flight on the shared network manager
+
+        Args:
+            tiles (list[tuple]): (tile_extent, width_px, height_px) of every tile
+            layer_name (str): Name of the WMS layer
+            write_tile (callable): Called with (index, content) for every finished tile
+
+        Returns:
+            bool: True if every tile was downloaded and written
+        """
+        queue = list(range(len(tiles)))
+        replies = {}
+        errors = []
+        written = [0]
+        loop = QEventLoop()
+
+        def abort_all():
+            queue.clear()
+            for reply in list(replies.values()):
+                reply.abort()
+
+        def start_next():
+            index = queue.pop(0)
+            tile_extent, width, height = tiles[index]
+            reply = self.manager.get(self._getmap_request(tile_extent, width, height, layer_name))
+            replies[index] = reply
+            reply.finished.connect(lambda index=index: on_finished(index))
+
+        def on_finished(index):
+            reply = replies.pop(index, None)
+            if reply is None:
+                return
+            if reply.error() == QNetworkReply.NoError:
+                try:
+                    write_tile(index, bytes(reply.readAll()))
+                    written[0] += 1
+                    if self.feedback and self.progress:
+                        # Only the sub-range of the downloader, the overall bar keeps moving forward
+                        start, span = self.progress
+                        self.feedback.setProgress(start + span * written[0] / len(tiles))
+                except Exception as e:
+                    errors.append(f"Tile {index + 1}/{len(tiles)}: {e}")
+                    abort_all()
+            elif reply.error() != QNetworkReply.OperationCanceledError:
+                errors.append(f"Tile {index + 1}/{len(tiles)}: {reply.errorString()}")
+                if self.feedback:
+                    self.feedback.reportError(f"HTTP Error: {reply.errorString()}")
+                abort_all()
+            reply.deleteLater()
+
+            if queue:
+                start_next()
+            elif not replies:
+                loop.quit()
+
+        for _ in range(min(self.max_connections, len(queue))):
+            start_next()
+
+        if not self._wait_for(loop):
+            abort_all()
+            self.feedback.reportError("Download canceled by user.")
+            return False
+        for error in errors:
+            self.log(error)
+        return not errors
+
+    def _wait_for(self, loop):
+        """
+        Runs a local event loop until it is quit or the user cancels.
+        The feedback canceled signal wakes the loop, no polling timer is needed
+
+        Args:
+            loop (QEventLoop): loop connected to the finished signal(s) to wait for
+
+        Returns:
+            bool: False if the user canceled
+        """
+        if self.feedback is None:
+            loop.exec_()
             return True
 
-        except Exception as e:
-            self.log(f"Error during tiled download: {e}")
+        if self.feedback.isCanceled():
             return False
+        self.feedback.canceled.connect(loop.quit)
+        try:
+            loop.exec_()
         finally:
-            shutil.rmtree(temp_dir, ignore_errors=True)
+            self.feedback.canceled.disconnect(loop.quit)
+        return not self.feedback.isCanceled()
+
+    def _new_request(self, url):
+        """
+        Creates a request with the connection settings shared by all calls to the service.
+        Qt keeps connections alive and negotiates gzip itself: setting Accept-Encoding
+        manually would disable its transparent decompression
+
+        Args:
+            url (QUrl): url to request
+
+        Returns:
+            QNetworkRequest: request ready to be sent
+        """
+        request = QNetworkRequest(url)
+        request.setAttribute(QNetworkRequest.FollowRedirectsAttribute, True)
+        # Multiplex parallel requests over a single connection to the server
+        request.setAttribute(QNetworkRequest.Http2AllowedAttribute, True)
+        request.setAttribute(QNetworkRequest.HttpPipeliningAllowedAttribute, True)
+        return request
+
+    def _getmap_request(self, extent, width, height, layer_name):
+        """
+        Builds the WMS GetMap request for an extent
+
+        Args:
+            extent (QgsRectangle): The area to request
+            width (int): Width in pixels
+            height (int): Height in pixels
+            layer_name (str): Name of the WMS layer
+
+        Returns:
+            QNetworkRequest: request ready to be sent
+        """
+        # Static and per-layer parameters are built once per layer, tiles only add their window
+        layer_query = self._layer_queries.get(layer_name)
+        if layer_query is None:
+            layer_query = QUrlQuery(self._getmap_query)
+            layer_query.addQueryItem("FORMAT", self._getmap_format())
+            layer_query.addQueryItem("LAYERS", layer_name)
+            self._layer_queries[layer_name] = layer_query
+
+        query = QUrlQuery(layer_query)
+        query.addQueryItem("BBOX", f"{extent.xMinimum()},{extent.yMinimum()},{extent.xMaximum()},{extent.yMaximum()}")
+        query.addQueryItem("WIDTH", str(int(width)))
+        query.addQueryItem("HEIGHT", str(int(height)))
+
+        url = QUrl(self.BASE_URL)
+        url.setQuery(query)
+        # self.log(f"Requesting URL: {url.toString()}") 
+
+        return self._new_request(url)
 
     def _download_single_tile(self, extent, width, height, output_path, layer_name):
         """
         Requests a single tile from IGN Wep Map Service
         """    
-        params = [
-            f"SERVICE=WMS",
-            f"VERSION=1.3.0",
-            f"REQUEST=GetMap",
-            f"LAYERS={layer_name}",
-            f"STYLES=normal",
-            f"FORMAT=image/tiff",
-            f"CRS={self.crs}",
-            f"BBOX={extent.xMinimum()},{extent.yMinimum()},{extent.xMaximum()},{extent.yMaximum()}",
-            f"WIDTH={int(width)}",
-            f"HEIGHT={int(height)}",
-            f"TRANSPARENT=false"
-        ]
-        
-        full_url_str = f"{self.BASE_URL}?" + "&".join(params)
-        # self.log(f"Requesting URL: {full_url_str}") 
+        reply = self.manager.get(self._getmap_request(extent, width, height, layer_name))
 
-        request = QNetworkRequest(QUrl(full_url_str))
-        request.setAttribute(QNetworkRequest.FollowRedirectsAttribute, True)
-        reply = self.manager.get(request)
+        # Wait for the reply without polling
+        loop = QEventLoop()
+        reply.finished.connect(loop.quit)
 
-        while reply.isRunning():
-            if self.feedback and self.feedback.isCanceled():
-                reply.abort()
-                self.feedback.reportError("Download canceled by user.")
-                return False
-            QCoreApplication.processEvents()
+        if not reply.isFinished() and not self._wait_for(loop):
+            reply.abort()
+            self.feedback.reportError("Download canceled by user.")
+            return False
 
         # Check HTTP Status
         if reply.error() != QNetworkReply.NoError:
@@ -428,25 +811,25 @@ class MNSDownloader:
             self.log(f"QNetworkReply Error: {reply.errorString()}")
             return False
 
-        content = reply.readAll()
+        # Single copy of the QByteArray into Python bytes
+        content = bytes(reply.readAll())
 
-        # Write Content to Disk
         if not content or len(content) < 100:
             if self.feedback:
-                self.feedback.reportError(f"Download failed (File too small). Server returned: {bytes(content)}")
+                self.feedback.reportError(f"Download failed (File too small). Server returned: {content}")
             return False
 
+        # Keep the response in memory, GDAL reads it from /vsimem/
+        raw_path = f"{self._vsimem_dir}/wms_in.tif"
+        gdal.FileFromMemBuffer(raw_path, content)
         try:
-            with open(output_path, 'wb') as f:
-                f.write(content)
-            
-            # Validation Step
-            is_valid, status_msg = self.validate_raster_content(output_path)
+            # Quick check only, read_tif validates the georeferenced result
+            is_valid, status_msg = self.validate_raster_content(raw_path, full=False)
             if not is_valid:
                 self.log(f"Downloaded file validation failed: {status_msg}")
                 return False
             
-            self._embed_georeferencing(output_path, extent, width, height)
+            self._embed_georeferencing(raw_path, output_path, extent)
             # self.log(f"Saved to {output_path}")
             return True
 
@@ -454,43 +837,97 @@ class MNSDownloader:
             if self.feedback:
                 self.feedback.reportError(f"GDAL Error: {e}")
             return False
+        finally:
+            gdal.Unlink(raw_path)
 
-    def _embed_georeferencing(self, tif_path, extent, width, height):
+    def _embed_georeferencing(self, raw_path, output, extent, size=None):
         """
-        Opens the existing TIFF using GDAL and injects spatial metadata (GeoTransform and Projection)
+        Writes the raw WMS TIFF with spatial metadata (GeoTransform and Projection)
+        and NoData set, in a single streaming GDAL pass
+
+        Args:
+            raw_path (str): Path of the TIFF returned by the WMS (may be a /vsimem/ path)
+            output (str or gdal.Dataset): Path of a new GeoTIFF, or an open raster
+                                          the tile is written into at its extent
+            extent (QgsRectangle): Extent covered by the tile
+            size (tuple[int, int], optional): Expected (width, height) of the tile
+
+        Raises:
+            Exception: If GDAL cannot read or write the raster
         """
-        ds = gdal.Open(tif_path, 1)
-        if ds is None:
+        # Georeferenced view on the raw file (VRT in memory, no pixel copy)
+        # -a_ullr equivalent: [ulx, uly, lrx, lry]
+        georef = gdal.Translate('', raw_path, options=gdal.TranslateOptions(
+            format='VRT',
+            outputBounds=[extent.xMinimum(), extent.yMaximum(), extent.xMaximum(), extent.yMinimum()],
+            outputSRS=self._projection_wkt
+        ))
+        if georef is None:
             raise Exception("Could not open file with GDAL.")
-        
-        nodata_val = -9999.0
-        band = ds.GetRasterBand(1)
-        data = band.ReadAsArray()
-        data[data < -1000] = nodata_val
-        band.WriteArray(data) 
-        if band:
-            band.SetNoDataValue(nodata_val)
-
-        x_res = (extent.xMaximum() - extent.xMinimum()) / width
-        y_res = (extent.yMaximum() - extent.yMinimum()) / height
-        
-        # GeoTransform list format:
-        # [0] Top-Left X Coordinate
-        # [1] W-E Pixel Resolution
-        # [2] Rotation
-        # [3] Top-Left Y Coordinate
-        # [4] Rotation
-        # [5] N-S Pixel Resolution (negative for north-up)
-        geotransform = [
-            extent.xMinimum(), x_res, 0,
-            extent.yMaximum(), 0, -y_res
-        ]
-        ds.SetGeoTransform(geotransform)
-
-        srs = osr.SpatialReference()
-        srs.SetFromUserInput(self.crs) 
-        
-        ds.SetProjection(srs.ExportToWkt())
-        # Close the file
-        band.FlushCache()
-        ds = None
\ No newline at end of file
+        if size and (georef.RasterXSize, georef.RasterYSize) != tuple(size):
+            raise Exception(f"Unexpected tile size {georef.RasterXSize}x{georef.RasterYSize}")
+
+        src_nodata = georef.GetRasterBand(1).GetNoDataValue()
+        if src_nodata is None:
+            src_nodata = self.SOURCE_NODATA
+
+        # Remap the declared service NoData to NODATA_VALUE while writing, in GDAL's C code
+        if isinstance(output, str):
+            # Same grid as the WMS tile, pixels are copied 1:1 even when they are not square
+            warp_options = gdal.WarpOptions(
+                format='GTiff',
+                width=georef.RasterXSize,
+                height=georef.RasterYSize,
+                outputBounds=[extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()],
+                srcNodata=src_nodata,
+                dstNodata=self.NODATA_VALUE,
+                multithread=True,
+                warpOptions=['NUM_THREADS=ALL_CPUS'],
+                creationOptions=self.GTIFF_OPTIONS + ['NUM_THREADS=ALL_CPUS']
+            )
+        else:
+            warp_options = gdal.WarpOptions(
+                srcNodata=src_nodata,
+                dstNodata=self.NODATA_VALUE,
+                multithread=True,
+                warpOptions=['INIT_DEST=NO_DATA', 'NUM_THREADS=ALL_CPUS']
+            )
+        ds = gdal.Warp(output, georef, options=warp_options)
+        georef = None
+        if ds is None:
+            raise Exception("Could not write georeferenced tile.")
+
+        # Other sentinels (or a declared NoData the file does not use) are below the threshold
+        gt = ds.GetGeoTransform()
+        xoff = int(round((extent.xMinimum() - gt[0]) / gt[1]))
+        yoff = int(round((extent.yMaximum() - gt[3]) / gt[5]))
+        width, height = size if size else (ds.RasterXSize, ds.RasterYSize)
+        self._mask_below_threshold(ds.GetRasterBand(1), xoff, yoff, width, height)
+        if isinstance(output, str):
+            # Close the file
+            ds = None
+
+    def _mask_below_threshold(self, band, xoff, yoff, width, height):
+        """
+        Sets the pixels of a window below NODATA_THRESHOLD to NODATA_VALUE, block by block.
+        Blocks without such pixels are only read, most tiles are written once by Warp
+
+        Args:
+            band (gdal.Band): Band of the written raster, opened for update
+            xoff (int): First column of the window
+            yoff (int): First row of the window
+            width (int): Width of the window in pixels
+            height (int): Height of the window in pixels
+        """
+        block_x, block_y = band.GetBlockSize()
+        # Windows follow the raster blocks, clipped to the tile
+        for block_top in range(yoff - yoff % block_y, yoff + height, block_y):
+            y = max(block_top, yoff)
+            rows = min(block_top + block_y, yoff + height) - y
+            for block_left in range(xoff - xoff % block_x, xoff + width, block_x):
+                x = max(block_left, xoff)
+                data = band.ReadAsArray(x, y, min(block_left + block_x, xoff + width) - x, rows)
+                sentinels = (data < self.NODATA_THRESHOLD) & (data != self.NODATA_VALUE)
+                if sentinels.any():
+                    data[sentinels] = self.NODATA_VALUE
+                    band.WriteArray(data, x, y)
@@ -4,11 +4,116 @@ Part of MarcheALOmbre QGIS Plugin
 Copyright (C) 2025 Yolanda Seifert
 Licensed under GPL v2+
 """
-import numpy as np
+import os
 import math
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from osgeo import gdal
 
+AZIMUTH_BINS = 3600 # rays are cached per 0.1 degree of sun azimuth
+AZIMUTH_BIN_RAD = 2 * math.pi / AZIMUTH_BINS
+Z_SCALE = 0.1 # elevations are stored as uint16 decimeters above the lowest valid pixel
+NODATA_MAX = -9000.0 # elevations at or below this are NoData
+NODATA_CODE = 0 # encoded NoData, valid pixels are encoded from 1 up
+
+
+def encode_elevations(data):
+    """
+    Stores elevations as uint16 decimeters above an offset, half the memory of Float32.
+    NoData becomes NODATA_CODE, which rays_shaded never treats as an obstacle.
+    If the elevation range does not fit (more than 6553 m) the data is kept as it is
+
+    Args:
+        data (np.ndarray): elevations in meters
+
+    Returns:
+        tuple[np.ndarray, tuple[float, float]]: (encoded data, (offset, scale)), meters = offset + value * scale
+    """
+    valid = data > NODATA_MAX
+    if not valid.any():
+        return data, (0.0, 1.0)
+
+    offset = float(data[valid].min()) - Z_SCALE
+    top = (float(data[valid].max()) - offset) / Z_SCALE
+    if top > np.iinfo(np.uint16).max:
+        return data, (0.0, 1.0)
+
+    encoded = np.zeros(data.shape, dtype=np.uint16)
+    encoded[valid] = np.rint((data[valid] - offset) / Z_SCALE)
+    return encoded, (offset, Z_SCALE)
+
+
+def _line_offsets(major, minor, resolution):
+    """Bresenham line from the origin to (major, minor) with major >= minor >= 0.
+    The pixels are computed in closed form with numpy instead of stepping the error term,
+    the result is identical to the iterative algorithm
+
+    Args:
+        major (int): length of the line along its major axis in pixels
+        minor (int): length of the line along its minor axis in pixels
+        resolution (float): resolution of the raster
+
+    Returns:
+        tuple: (major_steps, minor_steps, dist_m) offsets of every pixel and their distance in meters
+    """
+    # One pixel per step along the major axis, the minor axis advances
+    # once the accumulated error passes half a pixel (ties stay behind)
+    steps = np.arange(major + 1)
+    minor_steps = (2 * steps * minor + major - 1) // (2 * major) if major else steps
+    dist_m = np.hypot(steps, minor_steps) * resolution
+    for arr in (steps, minor_steps, dist_m):
+        arr.flags.writeable = False
+    return steps, minor_steps, dist_m
+
+
+def ray_template(direction_bin, max_dist_pixels, resolution, cache=None):
+    """Draw bresenham line from the origin for a quantized azimuth.
+    The 8 octants are mirror images of each other: the azimuth is folded into 0-45 degrees
+    and one cached line (swapped and signed per octant) serves all of them. Points
+    sharing a sun azimuth bin only shift the offsets to their own pixels
+
+    Args:
+        direction_bin (int): azimuth bin, the angle is direction_bin * AZIMUTH_BIN_RAD
+        max_dist_pixels (int): maximum distance in pixels
+        resolution (float): resolution of the raster
+        cache (dict, optional): folded lines already computed, filled with the new one. Defaults to None.
+
+    Returns:
+        tuple: (sx, sy, abs_dx, abs_dy, dist_m) x/y step signs, absolute offsets
+               of every pixel of the line and their distance to the origin in meters
+    """
+    direction_bin %= AZIMUTH_BINS
+    quarter = AZIMUTH_BINS // 4
+
+    # Angle to the north/south axis (0-90 degrees), then to the closest axis (0-45 degrees)
+    half = direction_bin % (2 * quarter)
+    to_axis = min(half, 2 * quarter - half)
+    folded = min(to_axis, quarter - to_axis) * AZIMUTH_BIN_RAD
+    major = int(max_dist_pixels * math.cos(folded))
+    minor = int(max_dist_pixels * math.sin(folded))
+
+    # x grows to the east (0-180 degrees), rows grow to the south (90-270 degrees)
+    sx = 1 if 0 < direction_bin < 2 * quarter else -1
+    sy = 1 if quarter < direction_bin < 3 * quarter else -1
+
+    key = (major, minor, resolution)
+    offsets = cache.get(key) if cache is not None else None
+    if offsets is None:
+        offsets = _line_offsets(major, minor, resolution)
+        if cache is not None:
+            cache[key] = offsets
+    major_steps, minor_steps, dist_m = offsets
+    if to_axis <= quarter - to_axis:
+        # Closer to north/south: rows are the major axis
+        return sx, sy, minor_steps, major_steps, dist_m
+    return sx, sy, major_steps, minor_steps, dist_m
+
+
 class ShadowCalculator:
+
+    RAY_CHUNK_PX = 256 # pixels read per step of a ray before checking for an obstacle
+    MAX_WORKERS = os.cpu_count() or 1
+    MIN_POINTS_PER_WORKER = 200 # below this, thread start up costs more than it saves
     
     def __init__(self, high_res_path, low_res_path):
         """
@@ -25,159 +130,177 @@ class ShadowCalculator:
         if not self.high_ds:
             raise Exception(f"Could not open High-Res MNS: {high_res_path}")
         self.high_gt = self.high_ds.GetGeoTransform()
+        self.high_data, self.high_z = encode_elevations(self.high_ds.GetRasterBand(1).ReadAsArray())
         self.high_res = self.high_gt[1]
-        self.high_data = self.high_ds.GetRasterBand(1).ReadAsArray()
         self.high_rows, self.high_cols = self.high_data.shape
 
         self.low_ds = gdal.Open(low_res_path)
         if not self.low_ds:
             raise Exception(f"Could not open Low-Res MNS: {low_res_path}")
         self.low_gt = self.low_ds.GetGeoTransform()
+        self.low_data, self.low_z = encode_elevations(self.low_ds.GetRasterBand(1).ReadAsArray())
         self.low_res = self.low_gt[1]
-        self.low_data = self.low_ds.GetRasterBand(1).ReadAsArray()
         
         self.low_rows, self.low_cols = self.low_data.shape
 
-    def _to_pixel(self, x, y, gt):
+        # Folded ray lines of this calculation, freed with the calculator
+        self._ray_cache = {}
+
+    def _to_pixel(self, xs, ys, gt):
         """
         Convert world coordinates to raster pixel coordinates
 
         Args:
-            x (float): x coordinate
-            y (float): y coordinate
+            xs (np.ndarray): x coordinates
+            ys (np.ndarray): y coordinates
             gt (tuple): gdal GeoTransform
 
         Returns:
-            tuple[int, int]: (column, row)
+            tuple[np.ndarray, np.ndarray]: (columns, rows), truncated like int()
         """
-        col = int((x - gt[0]) / gt[1])
-        row = int((y - gt[3]) / gt[5])
-        return col, row
+        cols = ((xs - gt[0]) / gt[1]).astype(np.int64)
+        rows = ((ys - gt[3]) / gt[5]).astype(np.int64)
+        return cols, rows
 
-    def draw_bresenham_line(self, x0, y0, max_dist_pixels, azimuth, rows, cols):
-        """Draw bresenham line on a raster with given starting point
+    def ray_lengths(self, template, cols0, rows0, shape):
+        """
+        Number of pixels of a ray template inside the raster for every start pixel
 
         Args:
-            x0 (int): start x value
-            y0 (int): start y value
-            max_dist_pixels (float): maximum distance in pixels
-            azimuth (float): direction angle of line in radians
-            rows (int): number of rows in raster
-            cols (int): number of columns in raster
+            template (tuple): ray from ray_template
+            cols0 (np.ndarray): start columns, inside the raster
+            rows0 (np.ndarray): start rows, inside the raster
+            shape (tuple[int, int]): (rows, cols) of the raster
 
         Returns:
-            (int,int)[]: list of indices of resulting line
+            np.ndarray: ray lengths in pixels, at least 1
         """
-        delta_x = max_dist_pixels * np.sin(azimuth)
-        delta_y = max_dist_pixels * np.cos(azimuth)
-        x1 = int(x0 + delta_x)
-        y1 = int(y0 - delta_y)
+        sx, sy, abs_dx, abs_dy, _ = template
+        rows, cols = shape
 
-        dx = abs(x1 - x0)
-        dy = abs(y1 - y0)
-        
-        sx = 1 if x0 < x1 else -1
-        sy = 1 if y0 < y1 else -1
-        
-        D = dx - dy
-        
-        line = []
-        while True:
-            # Boundary check
-            if not (0 <= x0 < cols and 0 <= y0 < rows):
-                break
-
-            line.append((x0, y0))
+        # Offsets grow monotonically, so the border is found by binary search on each axis
+        limit_x = cols - 1 - cols0 if sx > 0 else cols0
+        limit_y = rows - 1 - rows0 if sy > 0 else rows0
+        return np.minimum(np.searchsorted(abs_dx, limit_x, side='right'),
+                          np.searchsorted(abs_dy, limit_y, side='right'))
 
-            if x0 == x1 and y0 == y1:
-                break
-                
-            D2 = 2 * D
-
-            # Adjust x
-            if D2 > -dy:
-                D = D - dy
-                x0 = x0 + sx
-
-            # Adjust y  
-            if D2 < dx:
-                D = D + dx
-                y0 = y0 + sy
-                
-        return line
-
-    def calc_angle(self, trail_point, index_list, start_px, mns_data, resolution, min_dist_m=0):
+    def rays_shaded(self, template, lengths, cols0, rows0, mns_data, z_encoding, h_viewers, tan_sun, min_dist_m):
         """
-        Calculates angles for all points in bresenham line at once using numpy
+        Checks for a group of points sharing a sun azimuth if an obstacle along their
+        bresenham line rises above the sun.
+        The ray template is shifted to every point at once (2D fancy indexing) and walked
+        in chunks, points drop out as soon as an obstacle is found so most rays stop early.
+        An obstacle at distance d hides the sun if (h - h_viewer) > d * tan(sun_elevation),
+        which avoids the arctan of every pixel
 
         Args:
-            trail_point: trail point from where angles are calculated
-            index_list (int,int)[]: index list from bresenham line
-            start_px (int, int): starting pixel (col, row)
+            template (tuple): ray from ray_template
+            lengths (np.ndarray): ray lengths from ray_lengths
+            cols0 (np.ndarray): start columns, inside the raster
+            rows0 (np.ndarray): start rows, inside the raster
             mns_data (array): MNS raster data
-            resolution (float): resolution of the raster
-            min_dist_m (float): minimum distance to check (overlap)
+            z_encoding (tuple[float, float]): (offset, scale) of mns_data from encode_elevations
+            h_viewers (np.ndarray): elevation of the eyes of the hiker
+            tan_sun (np.ndarray): tangent of the sun elevations
+            min_dist_m (np.ndarray): minimum distance to check (overlap), 0 skips the viewer pixel only
 
         Returns:
-            (float[], float): list of angles, furthest distance checked
+            np.ndarray: True where the sun is hidden
         """
-        if not index_list:
-            return np.array([]), 0.0
-
-        start_x, start_y = start_px
-        last_x, last_y = index_list[-1]
-        dist_end_sq = (last_x - start_x)**2 + (last_y - start_y)**2
-        max_dist = math.sqrt(dist_end_sq) * resolution
-
-        path = np.array(index_list)
-        path_x = path[:, 0]
-        path_y = path[:, 1]
-
-        h_viewer = trail_point.z + 1.7
-        h_obstacles = mns_data[path_y, path_x]
+        sx, sy, abs_dx, abs_dy, dist_m = template
+        rows, cols = mns_data.shape
+
+        # Compare in the units of the encoded raster instead of decoding every pixel
+        offset, scale = z_encoding
+        h_viewers = (h_viewers - offset) / scale
+        tan_sun = tan_sun / scale
+
+        # Encoded NoData would decode to a real elevation below the raster minimum
+        encoded = mns_data.dtype == np.uint16
+
+        shaded = np.zeros(len(cols0), dtype=bool)
+        active = np.arange(len(cols0))
+        for begin in range(0, int(lengths.max(initial=0)), self.RAY_CHUNK_PX):
+            # Points still sunny whose ray did not leave the raster yet
+            active = active[lengths[active] > begin]
+            if len(active) == 0:
+                break
+            end = begin + self.RAY_CHUNK_PX
+            valid = np.arange(begin, begin + len(abs_dx[begin:end])) < lengths[active, None]
+
+            # Pixels past the border of a ray are clamped and masked out by valid
+            px = np.clip(cols0[active, None] + sx * abs_dx[begin:end], 0, cols - 1)
+            py = np.clip(rows0[active, None] + sy * abs_dy[begin:end], 0, rows - 1)
+            heights = mns_data[py, px]
+            if encoded:
+                valid &= heights != NODATA_CODE
+            height_diffs = heights - h_viewers[active, None]
+            dist = dist_m[begin:end]
+
+            # Only obstacles higher than viewer and outside the overlap can be above the sun
+            hit = (valid & (height_diffs > 0) & (dist > min_dist_m[active, None])
+                   & (height_diffs > dist * tan_sun[active, None])).any(axis=1)
+            shaded[active[hit]] = True
+            active = active[~hit]
+
+        return shaded
+
+    def _shade_group(self, indices, pixels, h_viewers, tan_el, bin_grid, bin_true, high_max_px, low_max_px):
+        """
+        Casts the High-Res and Low-Res rays of trail points sharing the same sun azimuth bins.
+        The short Low-Res rays are cast first, the long High-Res rays only for points
+        the distant relief does not already shade
 
-        # Filter only obstacles higher than viewer
-        mask = h_obstacles > h_viewer
-        
-        if not np.any(mask):
-            return np.array([]), max_dist 
+        Args:
+            indices (np.ndarray): indices of the points of the group
+            pixels (tuple): (h_cols, h_rows, in_high, l_cols, l_rows, in_low) of all points
+            h_viewers (np.ndarray): elevation of the eyes of the hiker of all points
+            tan_el (np.ndarray): tangent of the sun elevation of all points
+            bin_grid (int): azimuth bin of the sun relative to grid north
+            bin_true (int): azimuth bin of the sun relative to true north
+            high_max_px (int): maximum ray length in High-Res pixels
+            low_max_px (int): maximum ray length in Low-Res pixels
 
-        rel_x = path_x[mask]
-        rel_y = path_y[mask]
-        rel_h = h_obstacles[mask]
+        Returns:
+            np.ndarray: bool array, True where shady
+        """
+        h_cols, h_rows, in_high, l_cols, l_rows, in_low = pixels
+        shaded = np.zeros(len(indices), dtype=bool)
+        covered_dist = np.zeros(len(indices))
+
+        # Part of the rays covered by the High-Res raster, known without walking it
+        high_sel = np.flatnonzero(in_high[indices])
+        high_template = ray_template(bin_grid, high_max_px, self.high_res, self._ray_cache)
+        high_lengths = self.ray_lengths(high_template, h_cols[indices[high_sel]], h_rows[indices[high_sel]],
+                                        self.high_data.shape)
+        covered_dist[high_sel] = high_template[4][high_lengths - 1]
+
+        # Low-Res, skipping covered_dist
+        sel = np.flatnonzero(in_low[indices])
+        if len(sel):
+            pts = indices[sel]
+            low_template = ray_template(bin_true, low_max_px, self.low_res, self._ray_cache)
+            shaded[sel] = self.rays_shaded(
+                low_template, self.ray_lengths(low_template, l_cols[pts], l_rows[pts], self.low_data.shape),
+                l_cols[pts], l_rows[pts], self.low_data, self.low_z, h_viewers[pts], tan_el[pts], covered_dist[sel]
+            )
+
+        # High-Res, only for points not already shady
+        todo = ~shaded[high_sel]
+        sel = high_sel[todo]
+        if len(sel):
+            pts = indices[sel]
+            shaded[sel] = self.rays_shaded(
+                high_template, high_lengths[todo], h_cols[pts], h_rows[pts],
+                self.high_data, self.high_z, h_viewers[pts], tan_el[pts], np.zeros(len(sel))
+            )
+
+        return shaded
 
-        # Calculate Euclidean Distances
-        dist_sq = (rel_x - start_x)**2 + (rel_y - start_y)**2
-        
-        dist_mask = dist_sq > 0
-        dist_pixels = np.sqrt(dist_sq[dist_mask])
-        rel_h = rel_h[dist_mask]
-        
-        if len(dist_pixels) == 0:
-            return np.array([]), max_dist
-
-        dist_m = dist_pixels * resolution
-
-        # Filter min_dist_m (for Low Res)
-        if min_dist_m > 0:
-            dist_filter = dist_m > min_dist_m
-            if not np.any(dist_filter):
-                return np.array([]), max_dist
-            dist_m = dist_m[dist_filter]
-            rel_h = rel_h[dist_filter]
-
-        # Calculate angles
-        height_diffs = rel_h - h_viewer
-        angles_rad = np.arctan(height_diffs / dist_m)
-        
-        return angles_rad, max_dist
-    
     def calculate_shadows(self, trail_points, max_dist_m=20000):
         """
         Calculate if trail points are in shadow or sun along a trail.
-        Iterates through every trail point, casts a line in the direction of the sun azimuth,
-        and checks if any obstacle (from High-Res or Low-Res MNS) has an elevation angle
-        greater than the sun's current elevation
+        Packs the trail points into arrays and calls calculate_shadows_bulk
 
         Args:
             trail_points [TrailPoint]: trail points 
@@ -186,72 +309,80 @@ class ShadowCalculator:
         Returns:
             int[]: list of shadows (0=sunny,1=shady)
         """
-        results = []
-        
-        high_max_px = int(max_dist_m / self.high_res)
-        low_max_px = int(max_dist_m / self.low_res)
-
-        for tp in trail_points:
-            
-            # Night check
-            sun_elevation_rad = tp.solar_pos[0]
-            if sun_elevation_rad < 0:
-                results.append(1) # It is night/shady
-                continue
-
-            max_angle = -np.inf
-            covered_dist = 0.0
-
-            # High-Res
-            h_col, h_row = self._to_pixel(tp.x, tp.y, self.high_gt)
-            
-            # Boundary check
-            if 0 <= h_col < self.high_cols and 0 <= h_row < self.high_rows:
-                
-                # Draw line in azimuth direction
-                indices = self.draw_bresenham_line(
-                    h_col, h_row, high_max_px, tp.azimuth_grid, self.high_rows, self.high_cols
-                )
-                
-                # Calculate angles of line
-                angles_rad, covered_dist = self.calc_angle(
-                    tp, indices, (h_col, h_row), self.high_data, self.high_res, min_dist_m=0
-                )
-                
-                # Check shadow
-                if len(angles_rad) > 0:
-                    max_obstacle_angle = np.max(angles_rad)
-                    if max_obstacle_angle > sun_elevation_rad:
-                        results.append(1) # Shady
-                        continue # Skip check in Low-Res
-                    max_angle = max_obstacle_angle
-
-            # Low-Res
-            l_col, l_row = self._to_pixel(tp.x, tp.y, self.low_gt)
-            
-            # Boundary check
-            if 0 <= l_col < self.low_cols and 0 <= l_row < self.low_rows:
-                
-                # Draw line in azimuth direction
-                indices = self.draw_bresenham_line(
-                    l_col, l_row, low_max_px, tp.solar_pos[1], self.low_rows, self.low_cols
-                )
-                
-                # Calculate angles of line, skipping covered_dist
-                angles_rad, _ = self.calc_angle(
-                    tp, indices, (l_col, l_row), self.low_data, self.low_res, min_dist_m=covered_dist
-                )
-                
-                # Check shadow
-                if len(angles_rad) > 0:
-                    max_obstacle_angle = np.max(angles_rad)
-                    if max_obstacle_angle > max_angle:
-                        max_angle = max_obstacle_angle
-            
-            # Final check
-            if max_angle > sun_elevation_rad:
-                results.append(1) # Shady
-            else:
-                results.append(0) # Sunny
-            
-        return results
\ No newline at end of file
+        n = len(trail_points)
+        xs = np.fromiter((tp.x for tp in trail_points), dtype=np.float64, count=n)
+        ys = np.fromiter((tp.y for tp in trail_points), dtype=np.float64, count=n)
+        zs = np.fromiter((tp.z for tp in trail_points), dtype=np.float64, count=n)
+        sun_el = np.fromiter((tp.solar_pos[0] for tp in trail_points), dtype=np.float64, count=n)
+        sun_az = np.fromiter((tp.solar_pos[1] for tp in trail_points), dtype=np.float64, count=n)
+        sun_az_grid = np.fromiter((tp.azimuth_grid for tp in trail_points), dtype=np.float64, count=n)
+
+        return self.calculate_shadows_bulk(xs, ys, zs, sun_el, sun_az, sun_az_grid, max_dist_m).tolist()
+
+    def calculate_shadows_bulk(self, xs, ys, zs, sun_el, sun_az, sun_az_grid, max_dist_m=20000):
+        """
+        Calculate if points are in shadow or sun.
+        Casts a line from every point in the direction of the sun azimuth,
+        and checks if any obstacle (from High-Res or Low-Res MNS) has an elevation angle
+        greater than the sun's current elevation.
+        Points sharing the sun azimuth bins are processed together, the groups
+        are distributed on a thread pool
+
+        Args:
+            xs (np.ndarray): projected x coordinates
+            ys (np.ndarray): projected y coordinates
+            zs (np.ndarray): elevations of the points
+            sun_el (np.ndarray): sun elevations in radians
+            sun_az (np.ndarray): sun azimuths relative to true north in radians (Low-Res)
+            sun_az_grid (np.ndarray): sun azimuths relative to grid north in radians (High-Res)
+            max_dist_m (int, optional): maximum distance in which an obstacle which could cause shadow is searched
+
+        Returns:
+            np.ndarray: uint8 array of shadows (0=sunny,1=shady)
+        """
+        # Rays never get longer than the raster diagonal, keeps cached templates small
+        high_max_px = min(int(max_dist_m / self.high_res), math.ceil(math.hypot(self.high_rows, self.high_cols)))
+        low_max_px = min(int(max_dist_m / self.low_res), math.ceil(math.hypot(self.low_rows, self.low_cols)))
+
+        # Pixel positions and boundary checks of all points at once
+        h_cols, h_rows = self._to_pixel(xs, ys, self.high_gt)
+        in_high = (h_cols >= 0) & (h_cols < self.high_cols) & (h_rows >= 0) & (h_rows < self.high_rows)
+        l_cols, l_rows = self._to_pixel(xs, ys, self.low_gt)
+        in_low = (l_cols >= 0) & (l_cols < self.low_cols) & (l_rows >= 0) & (l_rows < self.low_rows)
+        h_viewers = zs + 1.7
+
+        # Trigonometry of the sun position once per point, the rays only compare and scale
+        tan_el = np.tan(sun_el)
+        bins_grid = np.rint(sun_az_grid / AZIMUTH_BIN_RAD).astype(np.int64) % AZIMUTH_BINS
+        bins_true = np.rint(sun_az / AZIMUTH_BIN_RAD).astype(np.int64) % AZIMUTH_BINS
+
+        # Night points are shady, day points outside both rasters have no obstacle (sunny)
+        night = sun_el < 0
+        results = night.astype(np.uint8)
+        day = np.flatnonzero(~night & (in_high | in_low))
+        if len(day) == 0:
+            return results
+
+        # Consecutive points mostly share the sun azimuth bins, their rays are cast together
+        pixels = (h_cols, h_rows, in_high, l_cols, l_rows, in_low)
+        keys = bins_grid[day] * AZIMUTH_BINS + bins_true[day]
+        order = np.argsort(keys, kind='stable')
+        starts = np.flatnonzero(np.diff(keys[order], prepend=-1))
+        groups = np.split(day[order], starts[1:])
+
+        def shade_group(group):
+            first = group[0]
+            shaded = self._shade_group(group, pixels, h_viewers, tan_el, int(bins_grid[first]),
+                                       int(bins_true[first]), high_max_px, low_max_px)
+            results[group] = shaded
+
+        n_workers = min(self.MAX_WORKERS, math.ceil(len(day) / self.MIN_POINTS_PER_WORKER))
+        if n_workers <= 1 or len(groups) <= 1:
+            for group in groups:
+                shade_group(group)
+            return results
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            # Every group writes its own indices of results
+            list(executor.map(shade_group, groups))
+        return results
@@ -4,14 +4,194 @@ Part of MarcheALOmbre QGIS Plugin
 Copyright (C) 2025 Yolanda Seifert
 Licensed under GPL v2+
 """
+import os
 import math
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from osgeo import gdal
 from qgis.core import (QgsCoordinateTransform, QgsPointXY, QgsGeometry, 
-                       QgsRectangle, QgsCoordinateReferenceSystem,
-                       QgsRasterLayer, QgsWkbTypes)
-from .trail_point import TrailPoint
-from .geo_definitions import REGIONS, MANUAL_DEFS
+                       QgsRectangle,
+                       QgsRasterLayer, QgsWkbTypes, QgsLineString, QgsCurve,
+                       QgsSpatialIndex)
+from .trail_point import TrailPoint, solar_positions
+from .geo_definitions import REGIONS, MANUAL_DEFS, manual_crs, proj_params, crs_from_authid
+
+# GRS80 first eccentricity (all MANUAL_DEFS projections use GRS80)
+GRS80_E = math.sqrt(0.00669438002290)
+
+def lcc_cone_constant(lat_1, lat_2, e=GRS80_E):
+    """
+    Cone constant n of a two standard parallel Lambert Conformal Conic projection
+
+    Args:
+        lat_1 (float): First standard parallel (radians)
+        lat_2 (float): Second standard parallel (radians)
+        e (float, optional): Ellipsoid eccentricity. Defaults to GRS80.
+
+    Returns:
+        float: Cone constant
+    """
+    def m(lat):
+        return math.cos(lat) / math.sqrt(1 - (e * math.sin(lat))**2)
+
+    def t(lat):
+        e_sin = e * math.sin(lat)
+        return math.tan(math.pi / 4 - lat / 2) / ((1 - e_sin) / (1 + e_sin))**(e / 2)
+
+    if lat_1 == lat_2:
+        return math.sin(lat_1)
+    return (math.log(m(lat_1)) - math.log(m(lat_2))) / (math.log(t(lat_1)) - math.log(t(lat_2)))
+
+def tobler_times(xs, ys, zs, speed, adjust_for_slope=True, break_index=-1, break_duration=0):
+    """
+    Cumulative walking time along a path using Tobler's hiking function
+
+    Args:
+        xs (np.ndarray): Projected X coordinates
+        ys (np.ndarray): Projected Y coordinates
+        zs (np.ndarray): Elevations
+        speed (float): Base speed on flat terrain (m/s)
+        adjust_for_slope (bool, optional): If False the base speed is used everywhere. Defaults to True.
+        break_index (int, optional): Index of the point where the break is taken. Defaults to -1 (no break).
+        break_duration (int, optional): Duration of the break (seconds). Defaults to 0.
+
+    Returns:
+        np.ndarray: Seconds elapsed at each point, starting at 0
+    """
+    n = len(xs)
+    dist_horizontal = np.hypot(np.diff(xs), np.diff(ys))
+    adjusted_speed = np.full(n - 1, float(speed))
+
+    if adjust_for_slope:
+        moving = dist_horizontal > 0
+        # Calculate slope
+        slope = np.divide(np.diff(zs), dist_horizontal, out=np.zeros(n - 1), where=moving)
+
+        # Tobler's hiking function
+        speed_factor = np.exp(-3.5 * np.abs(slope + 0.05))
+
+        # Limit speed between 30% and 150% of base speed
+        speed_factor = np.clip(speed_factor, 0.3, 1.5)
+
+        adjusted_speed[moving] *= speed_factor[moving]
+
+    segment_time = dist_horizontal / adjusted_speed
+    if 0 < break_index < n:
+        segment_time[break_index - 1] += break_duration
+    cum_time = np.empty(n)
+    cum_time[0] = 0.0
+    np.cumsum(segment_time, out=cum_time[1:])
+    return cum_time
+
+def densify_line(xy, max_sep, line_starts=()):
+    """
+    Inserts evenly spaced vertices into a line, with the same rule as QgsGeometry.densifyByDistance:
+    floor(segment length / max_sep) extra vertices per segment
+
+    Args:
+        xy (np.ndarray): (N, 2) array of line vertices
+        max_sep (float): Maximum separation distance between vertices
+        line_starts (np.ndarray, optional): Indices where xy continues with another line,
+            the segments leading to them are not densified
+
+    Returns:
+        tuple: (densified (M, 2) vertices, segment index of each vertex, position of each vertex along its segment (0-1))
+    """
+    if len(xy) < 2:
+        return xy.copy(), np.zeros(len(xy), dtype=np.int64), np.zeros(len(xy))
+    seg_len = np.hypot(*np.diff(xy, axis=0).T)
+    # Each segment emits its start vertex plus the inserted ones
+    counts = np.floor(seg_len / max_sep).astype(np.int64) + 1
+    counts[np.asarray(line_starts, dtype=np.int64) - 1] = 1
+    seg_index = np.repeat(np.arange(len(seg_len)), counts)
+    step = np.arange(len(seg_index)) - np.repeat(np.cumsum(counts) - counts, counts)
+    seg_pos = (1.0 / np.repeat(counts, counts)) * step
+    # Close the line with its last vertex
+    seg_index = np.append(seg_index, len(seg_len) - 1)
+    seg_pos = np.append(seg_pos, 1.0)
+    return interpolate_line(xy, seg_index, seg_pos), seg_index, seg_pos
+
+def interpolate_line(xy, seg_index, seg_pos):
+    """
+    Evaluates points along the segments of a line
+
+    Args:
+        xy (np.ndarray): (N, 2) array of line vertices
+        seg_index (np.ndarray): Segment index of each point
+        seg_pos (np.ndarray): Position of each point along its segment (0-1)
+
+    Returns:
+        np.ndarray: (M, 2) array of points
+    """
+    if len(xy) < 2:
+        return xy.copy()
+    start = xy[seg_index]
+    dense = start + seg_pos[:, None] * (xy[seg_index + 1] - start)
+    # Keep the exact line vertices
+    dense[seg_pos == 1.0] = xy[seg_index[seg_pos == 1.0] + 1]
+    return dense
+
+def offset_line(xy, offset):
+    """
+    Shifts every point of a line sideways, perpendicular to the direction to the next point
+
+    Args:
+        xy (np.ndarray): (N, 2) array of line points, N >= 2
+        offset (float): Distance in meters, positive to the left and negative to the right
+
+    Returns:
+        np.ndarray: (N, 2) array of shifted points
+    """
+    # Direction to the next point, the last point reuses the previous segment
+    d = np.diff(xy, axis=0)
+    d = np.vstack((d, d[-1:]))
+    length = np.hypot(d[:, 0], d[:, 1])
+    length[length == 0] = 1.0
+
+    # Left Normal: (-uy, ux)
+    normal = np.column_stack((-d[:, 1], d[:, 0])) / length[:, None]
+    return xy + offset * normal
+
+def vertex_array(geometry):
+    """
+    Copies the vertices of a geometry into an array
+
+    Args:
+        geometry (QgsGeometry): The input geometry
+
+    Returns:
+        np.ndarray: (N, 2) float64 array of x, y coordinates
+    """
+    line = geometry.constGet()
+    lines = [line] if isinstance(line, QgsLineString) else list(geometry.constParts())
+    if lines and all(isinstance(part, QgsLineString) for part in lines):
+        # Copy the coordinate vectors directly, no per-vertex QgsPoint
+        xs = np.concatenate([np.array(part.xVector(), dtype=np.float64) for part in lines])
+        ys = np.concatenate([np.array(part.yVector(), dtype=np.float64) for part in lines])
+        return np.column_stack((xs, ys))
+    coords = np.fromiter((c for v in geometry.vertices() for c in (v.x(), v.y())), dtype=np.float64)
+    return coords.reshape(-1, 2)
+
+@functools.lru_cache(maxsize=None)
+def region_index():
+    """
+    Builds the spatial index of the REGIONS bounding boxes once per session
+
+    Returns:
+        tuple: (tuple of (name, bbox, epsg) in REGIONS order, QgsSpatialIndex keyed by that order)
+    """
+    regions = tuple((name, tuple(data['bbox']), data['epsg']) for name, data in REGIONS.items())
+    index = QgsSpatialIndex()
+    for i, (_, b, _) in enumerate(regions):
+        index.addFeature(i, QgsRectangle(b[0], b[1], b[2], b[3]))
+    return regions, index
 
 class Trail:
+
+    SAMPLE_WORKERS = os.cpu_count() or 1
+    MIN_BLOCKS_PER_WORKER = 4 # raster blocks read per thread before threading pays off
+
     def __init__(self, max_sep, speed, source_crs, transform_context, feedback=None):
         """
         Initializes the Trail
@@ -27,15 +207,33 @@ class Trail:
         self.max_sep = max_sep
         self.src = source_crs
         if not self.src.isValid():
-            self.src = QgsCoordinateReferenceSystem("EPSG:4326")
+            self.src = crs_from_authid("EPSG:4326")
         self.transform_context = transform_context
-        self.wgs84 = QgsCoordinateReferenceSystem("EPSG:4326")
+        self.wgs84 = crs_from_authid("EPSG:4326")
         self.trail_points = []
+        # Parallel arrays of trail_points for vectorized processing
+        self._alloc_arrays(0)
         self.extent = QgsRectangle()
         self.feedback = feedback
         self.center_lat = 0.0
         self.break_index = -1
         self.break_duration = 0
+        self.convergence = 0.0
+
+    def _alloc_arrays(self, n):
+        """
+        Allocates the coordinate arrays mirroring trail_points
+
+        Args:
+            n (int): Number of trail points
+        """
+        self.xs = np.empty(n)
+        self.ys = np.empty(n)
+        self.zs = np.zeros(n)
+        self.lats = np.empty(n)
+        self.lons = np.empty(n)
+        # Seconds since departure
+        self.elapsed_s = np.zeros(n, dtype=np.int64)
 
     def log(self, message):
         """
@@ -49,25 +247,26 @@ class Trail:
         else:
             print(message)
 
-    def _determine_best_crs(self, wgs84_extent):
+    def _determine_best_crs(self, center):
         """
         Check which region contains the center of the trail extent
 
         Args:
-            wgs84_extent (QgsRectangle): The extent of the layer in WGS84.
+            center (QgsPointXY): The center of the layer extent in WGS84.
 
         Returns:
             tuple: A tuple containing (epsg_code (str), region_name (str)).
         """
-        center = wgs84_extent.center()
         lon = center.x()
         lat = center.y()
 
-        for name, data in REGIONS.items():
-            b = data['bbox']
+        regions, index = region_index()
+        # REGIONS order decides between overlapping boxes
+        for i in sorted(index.intersects(QgsRectangle(lon, lat, lon, lat))):
+            name, b, epsg = regions[i]
             # Bounding box check
             if b[0] <= lon <= b[2] and b[1] <= lat <= b[3]:
-                return data['epsg'], name
+                return epsg, name
         
         # Default to France
         return "EPSG:2154", "France_Metropole (Default)"
@@ -88,6 +287,27 @@ class Trail:
             return QgsGeometry.fromPolylineXY(nodes)
         return geometry
     
+    def _analytic_convergence(self, lon, lat):
+        """Closed form Meridian Convergence for the LCC and UTM target projections
+
+        Args:
+            lon (float): Longitude (WGS84, degrees)
+            lat (float): Latitude (WGS84, degrees)
+
+        Returns:
+            float: Convergence value, None if the target projection is not LCC or UTM
+        """
+        params = proj_params(self.target_crs)
+        lat_rad = math.radians(lat)
+        if params.get('proj') == 'lcc':
+            n = lcc_cone_constant(math.radians(float(params['lat_1'])),
+                                  math.radians(float(params['lat_2'])))
+            return -n * math.radians(lon - float(params['lon_0']))
+        if params.get('proj') == 'utm':
+            lon_0 = 6 * int(params['zone']) - 183
+            return -math.atan(math.tan(math.radians(lon - lon_0)) * math.sin(lat_rad))
+        return None
+
     def calc_meridian_convergence(self, source_center):
         """Calculates Meridian Convergence correction
 
@@ -99,8 +319,21 @@ class Trail:
         """
         convergence = 0.0
         try:
-            center_l93 = self.transform.transform(source_center)
-            center_geo = self.to_wgs84.transform(center_l93)
+            center_l93 = None
+            if self.src.authid() == self.wgs84.authid():
+                center_geo = source_center
+            else:
+                center_l93 = self.transform.transform(source_center)
+                center_geo = self.to_wgs84.transform(center_l93)
+
+            analytic = self._analytic_convergence(center_geo.x(), center_geo.y())
+            if analytic is not None:
+                self.log(f"Meridian Convergence at trail center: {math.degrees(analytic):.4f} deg")
+                return analytic
+
+            # Numerical fallback for other projections
+            if center_l93 is None:
+                center_l93 = self.transform.transform(source_center)
             # Create point slightly North (True North)
             north_geo = QgsPointXY(center_geo.x(), center_geo.y() + 0.1) 
             north_l93 = self.to_wgs84.transform(north_geo, QgsCoordinateTransform.ReverseTransform)
@@ -138,13 +371,14 @@ class Trail:
         if source_tracks.featureCount() == 0:
             raise Exception("Input layer contains no features. If using a GPX file, ensure you selected 'tracks' and not 'routes'.")
         
-        wgs84_extent = source_tracks.sourceExtent()
-        self.center_lat = wgs84_extent.center().y()
+        # sourceExtent() may scan the whole provider, query it only once
+        extent_center = source_tracks.sourceExtent().center()
+        self.center_lat = extent_center.y()
         self.adjust_for_slope = adjust_for_slope
 
-        self.target_crs, region_name = self._determine_best_crs(source_tracks.sourceExtent())
+        self.target_crs, region_name = self._determine_best_crs(extent_center)
         self.log(f"Detected Region: {region_name}. Switching to CRS: {self.target_crs}")
-        dest_crs = QgsCoordinateReferenceSystem(self.target_crs)
+        dest_crs = crs_from_authid(self.target_crs)
         self.transform = QgsCoordinateTransform(self.src, dest_crs, self.transform_context)
         self.to_wgs84 = QgsCoordinateTransform(dest_crs, self.wgs84, self.transform_context)
 
@@ -153,7 +387,7 @@ class Trail:
         if not self.transform.isValid() and auth_id in MANUAL_DEFS:
             print(f"WARNING: Standard {auth_id} failed. Switching to Manual Definition.")
             # Create CRS from raw Proj4 string
-            dest_crs = QgsCoordinateReferenceSystem.fromProj4(MANUAL_DEFS[auth_id])
+            dest_crs = manual_crs(auth_id)
             # Redo tranformations
             self.transform = QgsCoordinateTransform(self.src, dest_crs, self.transform_context)
             self.transform.setBallparkTransformsAreAppropriate(True)
@@ -185,198 +419,162 @@ class Trail:
                 print(f"ERROR: Failed to transform break point: {e}")
                 transformed_break_point = None
 
-        meridian_convergence = self.calc_meridian_convergence(source_tracks.sourceExtent().center())
-        total_dist = 0.0
-        center_points = []
-        
-        for feature in source_tracks.getFeatures():
-            geom = feature.geometry()
-            if geom.isEmpty():
-                continue
+        meridian_convergence = self.calc_meridian_convergence(extent_center)
+        self.convergence = meridian_convergence
+        features = [(f.id(), f.geometry()) for f in source_tracks.getFeatures()]
+        features = [(fid, geom) for fid, geom in features if not geom.isEmpty()]
 
-            # Standardize geometry to list of lines
-            if geom.isMultipart():
-                lines = geom.asMultiPolyline()
-            else:
+        # Reproject all tracks at once instead of vertex by vertex
+        projected = QgsGeometry.collectGeometry([geom for _, geom in features])
+        try:
+            projected.transform(self.transform)
+            projected = [projected]
+        except Exception:
+            # Fall back to feature by feature, and vertex by vertex to only skip the failing ones
+            projected = []
+            for fid, geom in features:
+                geom = QgsGeometry(geom)
                 try:
-                    lines = [geom.asPolyline()]
-                except Exception as e:
-                    raise Exception(f"{e}. Input layer must be tracks.")
-            
+                    geom.transform(self.transform)
+                except Exception:
+                    geom, skipped = self._transform_by_vertex(geom)
+                    self.log(f"Warning: Skipped {skipped} vertices of feature {fid} that could not be transformed")
+                projected.append(geom)
+
+        line_parts = []
+        for geom in projected:
+            # Standardize geometry to list of lines
+            lines = []
+            for part in geom.constParts():
+                if not isinstance(part, QgsCurve):
+                    raise Exception(f"Unexpected {part.geometryType()} geometry. Input layer must be tracks.")
+                line = part.clone() if isinstance(part, QgsLineString) else part.curveToLine()
+                # Work in 2D
+                line.dropZValue()
+                line.dropMValue()
+                lines.append(line)
 
             for line in lines:
-                transformed_vertices = []
-                for pt in line:
-                    try:
-                        # Transform point
-                        trans_pt = self.transform.transform(QgsPointXY(pt))
-                        transformed_vertices.append(trans_pt)
-                    except:
-                        continue
-                
-                if not transformed_vertices:
+                if line.isEmpty():
                     continue
 
                 if reverse:
-                    transformed_vertices.reverse()
+                    line = line.reversed()
 
                 # Rebuild geometry in Lambert-93
-                new_geom = QgsGeometry.fromPolylineXY(transformed_vertices)
-                
-                # Densify 
-                densified_geom = new_geom.densifyByDistance(self.max_sep)
+                new_geom = QgsGeometry(line)
 
-                # Extract points and calculate Lat/Lon
-                verts = densified_geom.vertices()
-                prev_pt = None
-                
-                for v in verts:
-                    pt_l93 = QgsPointXY(v.x(), v.y())
-                    geo_pt = self.to_wgs84.transform(pt_l93)
-                    
-                    # Calculate Distance for Time
-                    if prev_pt:
-                        dist = pt_l93.distance(prev_pt)
-                        total_dist += dist
-
-                    if adjust_for_slope:
-                        current_time = start_time  # Placeholder, will recalculate
-                    else:
-                        seconds_elapsed = total_dist / self.speed
-                        current_time = start_time.addSecs(int(seconds_elapsed))
-                    
-                    # Create TrailPoint object
-                    tp = TrailPoint(
-                        x=pt_l93.x(),
-                        y=pt_l93.y(),
-                        z = 0, # implement with MNT
-                        lat=geo_pt.y(), # Latitude
-                        lon=geo_pt.x(), # Longitude
-                        datetime=current_time,
-                        convergence=meridian_convergence
-                    )
-                    
-                    center_points.append(tp)
-                    prev_pt = pt_l93
-
-        if not center_points:
+                # Drop GPS jitter far below the sampling distance before densifying
+                simplified_geom = new_geom.simplify(self.max_sep / 10)
+                if not simplified_geom.isEmpty():
+                    new_geom = simplified_geom
+
+                line_parts.append(vertex_array(new_geom))
+
+        if not line_parts:
             raise Exception("No trail points could be processed. Input layer must be tracks.")
-        
+
+        # Process all lines as one vertex array, line_starts marks where each next line begins
+        line_xy = np.concatenate(line_parts)
+        line_starts = np.cumsum([len(part) for part in line_parts])[:-1]
+
+        # Calculate Lat/Lon of the line vertices in one transform call
+        geo_geom = QgsGeometry(QgsLineString(line_xy[:, 0].tolist(), line_xy[:, 1].tolist()))
+        geo_geom.transform(self.to_wgs84)
+        line_geo = vertex_array(geo_geom)
+
+        # Densify, inserted points get their Lat/Lon interpolated along the segment
+        center_xy, seg_index, seg_pos = densify_line(line_xy, self.max_sep, line_starts)
+        center_geo = interpolate_line(line_geo, seg_index, seg_pos)
+
+        # Cumulative distance along the trail for Time, the gaps between lines don't count
+        step_len = np.hypot(*np.diff(center_xy, axis=0).T)
+        gaps = np.zeros(len(line_xy), dtype=bool)
+        gaps[line_starts - 1] = True
+        step_len[gaps[seg_index[:-1]]] = 0.0
+        cum_dist = np.empty(len(center_xy))
+        cum_dist[0] = 0.0
+        np.cumsum(step_len, out=cum_dist[1:])
+        total_dist = float(cum_dist[-1])
+        center_secs = (cum_dist / self.speed).astype(np.int64)
+        start_epoch = start_time.toSecsSinceEpoch()
+        if adjust_for_slope:
+            center_secs[:] = 0  # Placeholder, will recalculate
+
         if total_dist > 45000:
             self.log(f"WARNING: Trail length is {total_dist/1000:.1f} km, Processing may be slow.")
         
         if transformed_break_point:
             # Find the closest point to break location
-            closest_idx = 0
-            min_dist = float('inf')
-            
-            for i, tp in enumerate(center_points):
-                # Calculate distance
-                dist = math.sqrt((tp.x - transformed_break_point.x())**2 + (tp.y - transformed_break_point.y())**2)
-                if dist < min_dist:
-                    min_dist = dist
-                    closest_idx = i
+            dist_sq = np.square(center_xy[:, 0] - transformed_break_point.x()) + \
+                      np.square(center_xy[:, 1] - transformed_break_point.y())
+            closest_idx = int(np.argmin(dist_sq))
+            min_dist_sq = float(dist_sq[closest_idx])
             
             # Add 1 hour to all points after the break
-            if min_dist < 5000: # only apply if the point is somewhat near the trail
-                print(f"Applying 1h break at point {closest_idx} (Dist: {min_dist:.1f}m)")
+            if min_dist_sq < 5000.0 ** 2: # only apply if the point is somewhat near the trail
+                print(f"Applying 1h break at point {closest_idx} (Dist: {math.sqrt(min_dist_sq):.1f}m)")
                 self.break_index = closest_idx
                 self.break_duration = int(60 * picnic_duration)
-                for i in range(closest_idx, len(center_points)):
-                    tp = center_points[i]
-                    tp.datetime = tp.datetime.addSecs(int(60*picnic_duration))
-                    
-                    # Recalculate solar position for the new time
-                    tp.solar_pos = tp.calc_solar_pos(tp.datetime)
+                center_secs[closest_idx:] += self.break_duration
             else:
-                 self.log(f"Break point too far from trail ({min_dist:.1f}m). Ignored.")
+                 self.log(f"Break point too far from trail ({math.sqrt(min_dist_sq):.1f}m). Ignored.")
+        
+        # Solar position of the whole trail in one batch, times already include the break
+        center_solar = [values.tolist() for values in solar_positions(
+            start_epoch + center_secs, center_geo[:, 1], center_geo[:, 0], meridian_convergence)]
+        center_datetimes = [start_time.addSecs(secs) for secs in center_secs.tolist()]
+
+        # Create TrailPoint objects, z is set later from the MNT
+        center_points = TrailPoint.from_arrays(center_geo[:, 0].tolist(), center_geo[:, 1].tolist(),
+                                               center_xy[:, 0].tolist(), center_xy[:, 1].tolist(),
+                                               center_datetimes, meridian_convergence, center_solar)
+        xy_parts = [center_xy]
+        geo_parts = [center_geo]
+        secs_parts = [center_secs]
         
         # Add center points to main list
         self.trail_points.extend(center_points)
 
         # Generate Buffer trails
-        if buffer:
-            left_points = []
-            right_points = []
-            
+        if buffer and len(center_points) > 1:
             offset_dist = 5.0 # meters
-            
-            for i in range(len(center_points)):
-                current_tp = center_points[i]
-                
-                # Determine direction
-                p1 = current_tp
-                p2 = None
-                
-                if i < len(center_points) - 1:
-                    p2 = center_points[i+1]
-                elif i > 0:
-                    p2 = current_tp
-                    p1 = center_points[i-1]
-                else:
-                    continue
-                
-                dx = p2.x - p1.x
-                dy = p2.y - p1.y
-                length = math.sqrt(dx*dx + dy*dy)
-                
-                if length == 0:
-                    ux, uy = 0, 0
-                else:
-                    ux, uy = dx/length, dy/length
-                
-                # Normal Vectors (Perpendicular to path)
-                # Left Normal: (-uy, ux)
-                # Right Normal: (uy, -ux)
-                
-                # Left point
-                lx = current_tp.x + (offset_dist * (-uy))
-                ly = current_tp.y + (offset_dist * (ux))
-                
-                # Convert to Lat/Lon
-                try:
-                    l_geo = self.to_wgs84.transform(QgsPointXY(lx, ly))
-                    
-                    tp_left = TrailPoint(
-                        x=lx, y=ly, z=0,
-                        lat=l_geo.y(), lon=l_geo.x(),
-                        datetime=current_tp.datetime,
-                        convergence=meridian_convergence
-                    )
-                    tp_left.trail_type = "Left"
-                    tp_left.solar_pos = current_tp.solar_pos
-                    left_points.append(tp_left)
-                except:
-                    pass
-
-                # Right point
-                rx = current_tp.x + (offset_dist * (uy))
-                ry = current_tp.y + (offset_dist * (-ux))
-                
-                try:
-                    r_geo = self.to_wgs84.transform(QgsPointXY(rx, ry))
-                    
-                    tp_right = TrailPoint(
-                        x=rx, y=ry, z=0,
-                        lat=r_geo.y(), lon=r_geo.x(),
-                        datetime=current_tp.datetime,
-                        convergence=meridian_convergence
-                    )
-                    tp_right.trail_type = "Right"
-                    tp_right.solar_pos = current_tp.solar_pos
-                    right_points.append(tp_right)
-                except:
-                    pass
-
-            self.trail_points.extend(left_points)
-            self.trail_points.extend(right_points)
+            side_xy = np.concatenate((offset_line(center_xy, offset_dist), offset_line(center_xy, -offset_dist)))
+            side_x, side_y = side_xy.T
+
+            # Convert both sides to Lat/Lon with a single transform call
+            geo_geom = QgsGeometry(QgsLineString(side_x.tolist(), side_y.tolist()))
+            try:
+                geo_geom.transform(self.to_wgs84)
+                side_geo = vertex_array(geo_geom)
+            except Exception as e:
+                self.log(f"Warning: Could not transform buffer trails: {e}")
+                side_geo = None
+
+            if side_geo is not None:
+                n = len(center_points)
+                for start, trail_type in ((0, "Left"), (n, "Right")):
+                    part = slice(start, start + n)
+                    # Same time and sun as the center points
+                    side_points = TrailPoint.from_arrays(side_geo[part, 0].tolist(), side_geo[part, 1].tolist(),
+                                                         side_x[part].tolist(), side_y[part].tolist(),
+                                                         center_datetimes, meridian_convergence, center_solar)
+                    for tp_side in side_points:
+                        tp_side.trail_type = trail_type
+                    self.trail_points.extend(side_points)
+                    secs_parts.append(center_secs)
+                xy_parts.append(side_xy)
+                geo_parts.append(side_geo)
+
+        self._alloc_arrays(len(self.trail_points))
+        self.xs[:], self.ys[:] = np.concatenate(xy_parts).T
+        self.lons[:], self.lats[:] = np.concatenate(geo_parts).T
+        self.elapsed_s[:] = np.concatenate(secs_parts)
 
         # Calculate extent
         if self.trail_points:
-            temp_points = [QgsPointXY(tp.x, tp.y) for tp in self.trail_points]
-            
-            multipoint = QgsGeometry.fromMultiPointXY(temp_points)
-            self.extent = multipoint.boundingBox()
+            self.extent = QgsRectangle(float(self.xs.min()), float(self.ys.min()),
+                                       float(self.xs.max()), float(self.ys.max()))
             # Buffer around extent
             self.extent.grow(500.0)
             
@@ -384,6 +582,50 @@ class Trail:
         else:
             raise Exception("No trail points could be processed.")
         
+    def _transform_by_vertex(self, geom):
+        """
+        Transforms the lines of a geometry point by point, skipping the vertices that fail.
+        Slow fallback for geometries the whole geometry transform rejects
+
+        Args:
+            geom (QgsGeometry): Track geometry in the source CRS
+
+        Returns:
+            tuple: (QgsGeometry of the lines in the target CRS, number of skipped vertices)
+
+        Raises:
+            Exception: If a part of the geometry is not a line
+        """
+        lines = []
+        skipped = 0
+        for part in geom.constParts():
+            if not isinstance(part, QgsCurve):
+                raise Exception(f"Unexpected {part.geometryType()} geometry. Input layer must be tracks.")
+            line = part if isinstance(part, QgsLineString) else part.curveToLine()
+            vertices = []
+            for x, y in zip(line.xVector(), line.yVector()):
+                try:
+                    vertices.append(self.transform.transform(QgsPointXY(x, y)))
+                except Exception:
+                    skipped += 1
+            lines.append(vertices)
+        return QgsGeometry.fromMultiPolylineXY(lines), skipped
+
+    def _batch_solar_pos(self, points, epoch_s, lats, lons):
+        """
+        Recalculates the solar position of trail points in one batch after their times changed
+
+        Args:
+            points (list): TrailPoint objects to update
+            epoch_s (np.ndarray): New UTC times of the points as seconds since the Unix epoch
+            lats (np.ndarray): Latitudes of the points
+            lons (np.ndarray): Longitudes of the points
+        """
+        elevation, azimuth, azimuth_grid = solar_positions(epoch_s, lats, lons, self.convergence)
+        for tp, elev, az_true, az_grid in zip(points, elevation.tolist(), azimuth.tolist(), azimuth_grid.tolist()):
+            tp.solar_pos = (elev, az_true)
+            tp.azimuth_grid = az_grid
+
     def calculate_times_with_slope(self, start_time, buffered):
         """
         Recalculate arrival times for all trail points accounting for slope
@@ -412,58 +654,110 @@ class Trail:
             points_to_calculate = self.trail_points
         
         # Calculate times
-        total_time = 0.0  # seconds
-        points_to_calculate[0].datetime = start_time
-        
-        for i in range(1, len(points_to_calculate)):
-            prev_tp = points_to_calculate[i-1]
-            curr_tp = points_to_calculate[i]
-            
-            # Horizontal distance
-            dist_horizontal = math.sqrt(
-                (curr_tp.x - prev_tp.x)**2 + 
-                (curr_tp.y - prev_tp.y)**2
-            )
-            
-            if self.adjust_for_slope and dist_horizontal > 0:
-                # Calculate slope
-                delta_z = curr_tp.z - prev_tp.z
-                slope = delta_z / dist_horizontal
-                
-                # Tobler's hiking function
-                speed_factor = math.exp(-3.5 * abs(slope + 0.05))
+        n = len(points_to_calculate)
+        cum_time = tobler_times(self.xs[:n], self.ys[:n], self.zs[:n], self.speed,
+                                self.adjust_for_slope, self.break_index, self.break_duration)
+        total_time = float(cum_time[-1])
+        self.elapsed_s[:n] = cum_time
 
-                # Limit speed between 30% and 150% of base speed
-                speed_factor = max(0.3, min(speed_factor, 1.5))
-                
-                adjusted_speed = self.speed * speed_factor
-            else:
-                adjusted_speed = self.speed
-            
-            # Update time
-            segment_time = dist_horizontal / adjusted_speed
-            total_time += segment_time
-            if i == self.break_index:
-                total_time += self.break_duration
-            curr_tp.datetime = start_time.addSecs(int(total_time))
-            # Recalculate solar position since the time changed
-            curr_tp.solar_pos = curr_tp.calc_solar_pos(curr_tp.datetime)
+        points_to_calculate[0].datetime = start_time
+        for curr_tp, secs in zip(points_to_calculate[1:], self.elapsed_s[1:n].tolist()):
+            curr_tp.datetime = start_time.addSecs(secs)
+        # Recalculate solar position since the time changed
+        self._batch_solar_pos(points_to_calculate, start_time.toSecsSinceEpoch() + self.elapsed_s[:n],
+                              self.lats[:n], self.lons[:n])
         
         # If buffered, copy times from center to left and right trails
         if buffered:
             left_points = self.trail_points[center_count:2*center_count]
+            self.elapsed_s[center_count:2*center_count] = self.elapsed_s[:center_count]
+            self.elapsed_s[2*center_count:] = self.elapsed_s[:num_points - 2*center_count]
             right_points = self.trail_points[2*center_count:]
             
             for i in range(len(points_to_calculate)):
                 if i < len(left_points):
                     left_points[i].datetime = points_to_calculate[i].datetime
                     left_points[i].solar_pos = points_to_calculate[i].solar_pos
+                    left_points[i].azimuth_grid = points_to_calculate[i].azimuth_grid
                 if i < len(right_points):
                     right_points[i].datetime = points_to_calculate[i].datetime
                     right_points[i].solar_pos = points_to_calculate[i].solar_pos
+                    right_points[i].azimuth_grid = points_to_calculate[i].azimuth_grid
         
         self.log(f"Time calculation complete. Total hiking time: {total_time/3600:.2f} hours")
         
+    def _sample_with_gdal(self, mnt_path):
+        """
+        Fills zs from the MNT, reading each raster block that holds trail points once.
+        Blocks are spread over threads for long trails
+
+        Args:
+            mnt_path (str): File path to the MNT raster
+
+        Returns:
+            bool: False if the raster can't be read by GDAL as a north-up grid
+        """
+        ds = gdal.Open(mnt_path)
+        if ds is None:
+            return False
+        gt = ds.GetGeoTransform()
+        if gt[2] != 0 or gt[4] != 0:
+            return False
+        band = ds.GetRasterBand(1)
+
+        cols = np.floor((self.xs - gt[0]) / gt[1]).astype(np.int64)
+        rows = np.floor((self.ys - gt[3]) / gt[5]).astype(np.int64)
+        inside = (cols >= 0) & (cols < ds.RasterXSize) & (rows >= 0) & (rows < ds.RasterYSize)
+
+        # Default if outside raster or nodata
+        self.zs[:] = 0.0
+        if not inside.any():
+            return True
+        cols, rows = cols[inside], rows[inside]
+
+        # Group points by raster block
+        block_w, block_h = band.GetBlockSize()
+        block_cols = -(-ds.RasterXSize // block_w)
+        keys = (rows // block_h) * block_cols + cols // block_w
+        order = np.argsort(keys, kind='stable')
+        starts = np.flatnonzero(np.diff(keys[order], prepend=-1))
+        groups = np.split(order, starts[1:])
+        values = np.empty(len(cols))
+
+        def read_blocks(block_groups, block_band):
+            for group in block_groups:
+                xoff = int(cols[group[0]] // block_w) * block_w
+                yoff = int(rows[group[0]] // block_h) * block_h
+                window = block_band.ReadAsArray(xoff, yoff, min(block_w, ds.RasterXSize - xoff),
+                                                min(block_h, ds.RasterYSize - yoff))
+                if window is None:
+                    return False
+                values[group] = window[rows[group] - yoff, cols[group] - xoff]
+            return True
+
+        def read_blocks_threaded(block_groups):
+            # GDAL datasets must not be shared between threads
+            thread_ds = gdal.Open(mnt_path)
+            if thread_ds is None:
+                return False
+            return read_blocks(block_groups, thread_ds.GetRasterBand(1))
+
+        n_workers = min(self.SAMPLE_WORKERS, math.ceil(len(groups) / self.MIN_BLOCKS_PER_WORKER))
+        if n_workers <= 1:
+            read_ok = read_blocks(groups, band)
+        else:
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                read_ok = all(executor.map(read_blocks_threaded, [groups[i::n_workers] for i in range(n_workers)]))
+        if not read_ok:
+            return False
+
+        nodata = band.GetNoDataValue()
+        invalid = np.isnan(values)
+        if nodata is not None:
+            invalid |= values == nodata
+        self.zs[inside] = np.where(invalid, 0.0, values)
+        return True
+
     def sample_elevation(self, mnt_path, start_time, buffered):
         """
         Loads the MNT raster from the given path and updates the z-value of all trail points
@@ -473,23 +767,31 @@ class Trail:
             start_time (QDateTime): Start time for recalculating arrival times
             buffer (bool): For time recalculation in calculate_times_with_slope
         """
-        # Load the MNT as a raster layer
-        rlayer = QgsRasterLayer(mnt_path, "mnt_sampling")
-        
-        if not rlayer.isValid():
-            print(f"Error: Could not load MNT from {mnt_path}")
-            return
+        if self._sample_with_gdal(mnt_path):
+            for tp, z in zip(self.trail_points, self.zs.tolist()):
+                tp.z = z
+        else:
+            # Load the MNT as a raster layer
+            rlayer = QgsRasterLayer(mnt_path, "mnt_sampling")
+            
+            if not rlayer.isValid():
+                print(f"Error: Could not load MNT from {mnt_path}")
+                return
 
-        provider = rlayer.dataProvider()
-        
-        # Loop through all points and sample the raster
-        for tp in self.trail_points:
-            val, res = provider.sample(QgsPointXY(tp.x, tp.y), 1)
+            provider = rlayer.dataProvider()
             
-            if res:
-                tp.z = val
-            else:
-                tp.z = 0.0 # Default if outside raster or nodata
+            # Loop through all points and sample the raster, reusing one point object
+            sample_pt = QgsPointXY(0.0, 0.0)
+            for i, tp in enumerate(self.trail_points):
+                sample_pt.setX(tp.x)
+                sample_pt.setY(tp.y)
+                val, res = provider.sample(sample_pt, 1)
+                
+                if res:
+                    tp.z = val
+                else:
+                    tp.z = 0.0 # Default if outside raster or nodata
+                self.zs[i] = tp.z
         
         # Recalculate times with slope adjustment if enabled
         if self.adjust_for_slope:
@@ -6,18 +6,99 @@ Licensed under GPL v2+
 """
 import math
 from datetime import datetime, timezone
+import numpy as np
 try:
     import pvlib
+    import pandas as pd
     HAS_PVLIB = True
 except (ImportError, ValueError, RuntimeError, OSError) as e:
     print(f"PVLib import failed ({e}). Using manual Solar Position Calculation")
     HAS_PVLIB = False
 
+def solar_positions(epoch_s, lats, lons, convergence):
+    """
+    Vectorized version of TrailPoint.calc_solar_pos for many points at once
+
+    Args:
+        epoch_s (np.ndarray): UTC times as seconds since the Unix epoch
+        lats (np.ndarray): Latitudes (WGS84, degrees)
+        lons (np.ndarray): Longitudes (WGS84, degrees)
+        convergence (float): meridian convergence
+
+    Returns:
+        tuple (np.ndarray): (elevation, azimuth, azimuth_grid) in radians
+    """
+    epoch_s = np.asarray(epoch_s, dtype=np.int64)
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    if HAS_PVLIB:
+        try:
+            # One SPA call for all points, lat/lon broadcast against the time index
+            times = pd.DatetimeIndex(pd.to_datetime(epoch_s, unit='s', utc=True))
+            sp = pvlib.solarposition.get_solarposition(times, lats, lons, altitude=None, pressure=None, method='nrel_numpy')
+            elevation = np.radians(90 - sp['zenith'].to_numpy(dtype=np.float64))
+            azimuth = np.radians(sp['azimuth'].to_numpy(dtype=np.float64))
+            # Apply Convergence (True Azimuth -> Grid Azimuth)
+            return elevation, azimuth, (azimuth + convergence + 2 * math.pi) % (2 * math.pi)
+        except Exception as e:
+            print(f"PVLib failed, falling back to manual: {e}")
+
+    # Time dependent terms only once per distinct timestamp (buffer points share them)
+    unique_s, inverse = np.unique(epoch_s, return_inverse=True)
+
+    # Calculate time variables
+    times = unique_s.astype('datetime64[s]')
+    days = times.astype('datetime64[D]')
+    day_of_year = (days - times.astype('datetime64[Y]')).astype(np.int64) + 1
+    hour_decimal = (times - days).astype(np.int64) / 3600.0
+
+    # Fractional year (gamma) in radians
+    gamma = (2 * math.pi / 365.0) * (day_of_year - 1 + (hour_decimal - 12) / 24)
+
+    # Multiple angles from sin/cos of gamma instead of further trig calls
+    sin_g, cos_g = np.sin(gamma), np.cos(gamma)
+    sin_2g, cos_2g = 2 * sin_g * cos_g, cos_g * cos_g - sin_g * sin_g
+    sin_3g, cos_3g = sin_g * (3 - 4 * sin_g * sin_g), cos_g * (4 * cos_g * cos_g - 3)
+
+    # Equation of time and Solar Declination (Spencer's Method), see calc_solar_pos
+    eqtime = 229.18 * (0.000075 + 0.001868 * cos_g - 0.032077 * sin_g \
+             - 0.014615 * cos_2g - 0.040849 * sin_2g)
+    decl = 0.006918 - 0.399912 * cos_g + 0.070257 * sin_g \
+           - 0.006758 * cos_2g + 0.000907 * sin_2g \
+           - 0.002697 * cos_3g + 0.00148 * sin_3g
+
+    # True Solar Time and Hour Angle
+    tst = (hour_decimal * 60 + eqtime)[inverse] + 4 * lons
+    ha_rad = np.radians((tst / 4) - 180)
+
+    lat_rad = np.radians(lats)
+    sin_dec, cos_dec = np.sin(decl)[inverse], np.cos(decl)[inverse]
+    sin_lat, cos_lat = np.sin(lat_rad), np.cos(lat_rad)
+    sin_ha, cos_ha = np.sin(ha_rad), np.cos(ha_rad)
+
+    # Elevation angle
+    sin_elev = sin_lat * sin_dec + cos_lat * cos_dec * cos_ha
+    elevation = np.arcsin(np.clip(sin_elev, -1.0, 1.0))
+
+    # Azimuth angle normalized to 0-2pi
+    x = -cos_ha * sin_lat * cos_dec + sin_dec * cos_lat
+    y = -sin_ha * cos_dec
+    azimuth = (np.arctan2(y, x) + 2 * math.pi) % (2 * math.pi)
+    azimuth_grid = (azimuth + convergence + 2 * math.pi) % (2 * math.pi)
+
+    return elevation, azimuth, azimuth_grid
+
 class TrailPoint:
 
-    def __init__(self, lon, lat, x, y, z, datetime, convergence):
+    # No per-instance __dict__, trails hold many thousands of points
+    __slots__ = ('lon', 'lat', 'x', 'y', 'z', 'datetime', 'convergence',
+                 'solar_pos', 'azimuth_grid', 'trail_type')
+
+    def __init__(self, lon, lat, x, y, z, datetime, convergence, solar=None):
         """
         Initializes a TrailPoint and automatically calculates the solar position
+        unless it is given
 
         Args:
             lon (float): Longitude (WGS84)
@@ -27,6 +108,8 @@ class TrailPoint:
             z (float): Elevation
             datetime (datetime): Time of arrival
             convergence (float): meridian convergence
+            solar (tuple, optional): Precomputed (elevation, azimuth, azimuth_grid) in radians,
+                e.g. from solar_positions(). Defaults to None.
         """
         self.lon = lon
         self.lat = lat
@@ -35,10 +118,45 @@ class TrailPoint:
         self.z = z
         self.datetime = datetime
         self.convergence = convergence
-        elev, az_true, self.azimuth_grid = self.calc_solar_pos(self.datetime)
+        if solar is None:
+            solar = self.calc_solar_pos(self.datetime)
+        elev, az_true, self.azimuth_grid = solar
         self.solar_pos = (elev, az_true)
 
 
+    @classmethod
+    def from_arrays(cls, lons, lats, xs, ys, datetimes, convergence, solar):
+        """
+        Builds TrailPoints in bulk from precomputed values, without the per-point
+        work of __init__
+
+        Args:
+            lons (list): Longitudes (WGS84)
+            lats (list): Latitudes (WGS84)
+            xs (list): Projected X coordinates
+            ys (list): Projected Y coordinates
+            datetimes (list): Times of arrival
+            convergence (float): meridian convergence
+            solar (tuple): (elevation, azimuth, azimuth_grid) lists in radians, e.g. from solar_positions()
+
+        Returns:
+            list (TrailPoint): One point per input element, z set to 0
+        """
+        points = []
+        for lon, lat, x, y, dt, elev, az_true, az_grid in zip(lons, lats, xs, ys, datetimes, *solar):
+            tp = cls.__new__(cls)
+            tp.lon = lon
+            tp.lat = lat
+            tp.x = x
+            tp.y = y
+            tp.z = 0
+            tp.datetime = dt
+            tp.convergence = convergence
+            tp.solar_pos = (elev, az_true)
+            tp.azimuth_grid = az_grid
+            points.append(tp)
+        return points
+
     def calc_solar_pos(self, dt):
         """
         Calculates Solar Azimuth and Elevation for a given place and time.
@@ -55,17 +173,11 @@ class TrailPoint:
             dt = dt.replace(tzinfo=timezone.utc)
 
         if HAS_PVLIB:
-            try:
-                sp = pvlib.solarposition.get_solarposition(dt, self.lat, self.lon, altitude=None, pressure=None, method='nrel_numpy')
-                azimuth_pvlib = sp['azimuth'].iloc[0]
-                elevation_pvlib = 90-sp['zenith'].iloc[0]
-                az_rad = math.radians(azimuth_pvlib)
-                # Apply Convergence (True Azimuth -> Grid Azimuth)
-                az_grid= (az_rad + self.convergence + 2 * math.pi) % (2 * math.pi)
-                return math.radians(elevation_pvlib), az_rad, az_grid
-            except Exception as e:
-                print(f"PVLib failed, falling back to manual: {e}")
-        
+            # Same pvlib path as the batched trail computation
+            elevation, azimuth, azimuth_grid = solar_positions(
+                [int(dt.timestamp())], [self.lat], [self.lon], self.convergence)
+            return float(elevation[0]), float(azimuth[0]), float(azimuth_grid[0])
+
         # Calculate time variables
         start_of_year = datetime(dt.year, 1, 1, tzinfo=timezone.utc)
         day_of_year = (dt - start_of_year).days + 1